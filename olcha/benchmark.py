@@ -0,0 +1,24 @@
+"""Timing helpers shared by the benchmark_* management commands."""
+import math
+import time
+
+
+def percentile(timings, p):
+    """Nearest-rank percentile of sorted timings."""
+    return timings[max(math.ceil(p / 100 * len(timings)) - 1, 0)]
+
+
+def measure(run, repeat):
+    """Call `run` `repeat` times, return the sorted durations in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings
+
+
+def p50_p95(run, repeat):
+    timings = measure(run, repeat)
+    return percentile(timings, 50), percentile(timings, 95)
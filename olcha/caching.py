@@ -0,0 +1,233 @@
+"""
+Generation based cache keys.
+
+Instead of wiping the whole cache whenever something changes, every cached
+entry is keyed by the current generation of the namespaces it depends on.
+Bumping a namespace makes every key built from it unreachable, the old
+entries simply expire on their own.
+
+Generations are microsecond timestamps of the last change, so they also
+give ETag and Last-Modified values for conditional requests for free.
+"""
+import gzip
+import hashlib
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import BrowsableAPIRenderer, TemplateHTMLRenderer
+from rest_framework.response import Response
+
+GENERATION_KEY = 'generation:{}'
+LOCK_KEY = 'lock:{}'
+
+PRODUCTS = 'products'
+# every product entry depends on it: attribute renames, bulk jobs
+CATALOG = 'catalog'
+CATEGORIES = 'categories'
+CATEGORY_GROUPS = 'category-groups'
+BRANDS = 'brands'
+
+# generation keys expire like any other entry, so namespaces nobody asks for
+# any more are culled; a counter that is gone restarts from the clock
+GENERATION_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def product_namespace(pk):
+    return f'product:{pk}'
+
+
+def category_products_namespace(category_id):
+    return f'products:category:{category_id}'
+
+
+def brand_products_namespace(brand_id):
+    return f'products:brand:{brand_id}'
+
+
+def product_namespaces(pk, category_id=None, brand_id=None):
+    """Namespaces that have to be bumped when a single product changes."""
+    namespaces = [PRODUCTS, product_namespace(pk)]
+    if category_id is not None:
+        namespaces.append(category_products_namespace(category_id))
+    if brand_id is not None:
+        namespaces.append(brand_products_namespace(brand_id))
+    return namespaces
+
+
+def _new_generation():
+    # a counter that went missing (first use or evicted) restarts from the
+    # clock, so it never hands out a generation that was used before
+    return time.time_ns() // 1000
+
+
+def get_generations(namespaces):
+    keys = [GENERATION_KEY.format(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    missing = {key: _new_generation() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=GENERATION_TIMEOUT)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(*namespaces):
+    keys = [GENERATION_KEY.format(namespace) for namespace in set(namespaces)]
+    current = cache.get_many(keys)
+    now = _new_generation()
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, timeout=GENERATION_TIMEOUT)
+
+
+def _digest(namespaces, generations, parts):
+    raw = repr((parts, list(zip(namespaces, generations))))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def make_key(prefix, namespaces, *parts):
+    """
+    Build a cache key for `prefix` that changes whenever one of `namespaces`
+    is bumped. `parts` distinguish entries inside the same prefix.
+    """
+    return f'{prefix}:{_digest(namespaces, get_generations(namespaces), parts)}'
+
+
+def canonical_query(query_params, names):
+    """
+    Order independent representation of the query params in `names`, so that
+    `?brand=1&ordering=price` and `?ordering=price&brand=1` share an entry.
+    """
+    canonical = []
+    for name in sorted(names):
+        values = sorted(value.strip() for value in query_params.getlist(name) if value.strip())
+        if name == 'search':
+            # SearchFilter AND-s the terms, so their order does not matter
+            values = sorted({term for value in values for term in value.replace(',', ' ').split()})
+        if values:
+            canonical.append((name, tuple(values)))
+    return tuple(canonical)
+
+
+def jittered(timeout, jitter=0.1):
+    """Spread expiry times so entries built together do not expire together."""
+    return timeout * random.uniform(1 - jitter, 1 + jitter)
+
+
+def get_or_build(cache_key, build, timeout=60, stale_timeout=None, lock_timeout=10, wait=5):
+    """
+    Like `cache.get_or_set`, but only one caller rebuilds an entry at a time.
+
+    Entries stay fresh for a jittered `timeout` and are then kept for another
+    `stale_timeout` seconds (defaults to `timeout`). A stale entry is served
+    to everybody while the caller holding the lock rebuilds it; on a full
+    miss the others wait up to `wait` seconds for that caller's result.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    lock_key = LOCK_KEY.format(cache_key)
+
+    entry = cache.get(cache_key)
+    if entry is not None:
+        fresh_until, value = entry
+        if fresh_until > time.time() or not cache.add(lock_key, 1, lock_timeout):
+            return value
+        locked = True
+    else:
+        locked = cache.add(lock_key, 1, lock_timeout)
+        if not locked:
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(cache_key)
+                if entry is not None:
+                    return entry[1]
+                if not cache.has_key(lock_key):
+                    # the builder failed, e.g. with a 404
+                    break
+
+    try:
+        value = build()
+        fresh_for = jittered(timeout)
+        cache.set(cache_key, (time.time() + fresh_for, value), fresh_for + stale_timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
+
+
+def accepts_gzip(request):
+    return getattr(settings, 'CACHE_RESPONSE_GZIP', True) and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+class RenderedBody:
+    """
+    An encoded response body as it is kept in the cache. It is not stored as
+    bare bytes, because tools that display cache values (the debug toolbar's
+    cache panel) decode those as text and fail on gzip data.
+    """
+    __slots__ = ('body', 'content_type', 'compressed')
+
+    def __init__(self, body, content_type, compressed):
+        self.body = body
+        self.content_type = content_type
+        self.compressed = compressed
+
+    def __iter__(self):
+        return iter((self.body, self.content_type, self.compressed))
+
+    def __str__(self):
+        return f"<{self.content_type} body, {len(self.body)} bytes{' gzip' if self.compressed else ''}>"
+
+    __repr__ = __str__
+
+
+def render(request, data):
+    """Encode `data` with the request's renderer like a DRF Response would."""
+    renderer = request.accepted_renderer
+    body = renderer.render(data, request.accepted_media_type, {'request': request})
+    content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+    compressed = getattr(settings, 'CACHE_RESPONSE_GZIP', True)
+    if compressed:
+        body = gzip.compress(body, mtime=0)
+    return RenderedBody(body, content_type, compressed)
+
+
+def cached_response(request, prefix, namespaces, build, *parts):
+    """
+    Response for a cached GET, answering conditional requests with
+    `304 Not Modified` before `build` or any query runs.
+
+    The cache keeps the encoded body (gzip-compressed unless
+    CACHE_RESPONSE_GZIP is off), so a hit is served without unpickling
+    Python data or running a renderer. The browsable API renders its page
+    per request, for it the data itself is cached.
+    """
+    generations = get_generations(namespaces)
+    digest = _digest(namespaces, generations, parts)
+    renderer = request.accepted_renderer
+    rendered = not isinstance(renderer, (BrowsableAPIRenderer, TemplateHTMLRenderer))
+    compressed = rendered and accepts_gzip(request)
+    etag = quote_etag(f'{digest}-{renderer.format}' + ('-gzip' if compressed else ''))
+    last_modified = max(generations) // 1_000_000
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    if rendered:
+        body, content_type, stored_compressed = get_or_build(f'{prefix}:{digest}:{request.accepted_media_type}',
+                                                             lambda: render(request, build()))
+        if stored_compressed and not compressed:
+            body = gzip.decompress(body)
+        response = HttpResponse(body, content_type=content_type)
+        if stored_compressed and compressed:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+    else:
+        response = Response(get_or_build(f'{prefix}:{digest}', build))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
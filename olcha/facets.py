@@ -0,0 +1,139 @@
+"""
+Facet counts for product listings.
+
+Counts per brand, price band and attribute value are stored per category in
+FacetCount and adjusted by signals whenever a product or one of its
+attributes changes, so a category page reads them with a single query.
+Listings filtered by more than the category are counted on the fly.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, When, Value, CharField, Count, F, Q
+
+from olcha.models import FacetCount, ProductAttribute, Brand, AttributeKey, AttributeValue, Category, Product
+
+# narx oraliqlarining chegaralari
+PRICE_BANDS = [100, 500, 1000, 5000, 10000, 50000, 100000]
+
+
+def _band_labels():
+    lower = [0] + PRICE_BANDS
+    upper = PRICE_BANDS + [None]
+    return [f'{low}-{high}' if high else f'{low}+' for low, high in zip(lower, upper)]
+
+
+BAND_LABELS = _band_labels()
+
+
+def price_band(price):
+    price = Decimal(str(price))
+    for bound, label in zip(PRICE_BANDS, BAND_LABELS):
+        if price < bound:
+            return label
+    return BAND_LABELS[-1]
+
+
+def price_band_expression():
+    return Case(
+        *[When(price__lt=bound, then=Value(label)) for bound, label in zip(PRICE_BANDS, BAND_LABELS)],
+        default=Value(BAND_LABELS[-1]),
+        output_field=CharField(),
+    )
+
+
+def attribute_value(key_id, value_id):
+    return f'{key_id}:{value_id}'
+
+
+def product_facets(brand_id, price):
+    """Facet values of a product itself, its attributes are counted separately."""
+    values = [('price', price_band(price))]
+    if brand_id is not None:
+        values.append(('brand', str(brand_id)))
+    return values
+
+
+def attribute_facets(product_id):
+    pairs = ProductAttribute.objects.filter(product_id=product_id).values_list('key_id', 'value_id')
+    return [('attribute', attribute_value(key_id, value_id)) for key_id, value_id in pairs]
+
+
+def apply(category_id, values, delta):
+    """Add `delta` to the stored counts of `values` in a category."""
+    if not values:
+        return
+    if delta > 0:
+        # decrements only touch existing rows, so a category being deleted
+        # does not get new rows from its cascading products
+        FacetCount.objects.bulk_create(
+            [FacetCount(category_id=category_id, facet=facet, value=value) for facet, value in values],
+            ignore_conflicts=True,
+        )
+    matching = Q()
+    for facet, value in values:
+        matching |= Q(facet=facet, value=value)
+    FacetCount.objects.filter(matching, category_id=category_id).update(count=F('count') + delta)
+
+
+def count_rows(products, attributes=None):
+    """(facet, value, count) rows for a product queryset, computed with GROUP BY."""
+    products = products.order_by()
+    attributes = attributes if attributes is not None else ProductAttribute.objects.all()
+    rows = [
+        ('brand', str(brand_id), count)
+        for brand_id, count in products.filter(brand__isnull=False).values_list('brand_id').annotate(count=Count('pk'))
+    ]
+    rows += [
+        ('price', band, count)
+        for band, count in products.annotate(band=price_band_expression()).values_list('band').annotate(count=Count('pk'))
+    ]
+    rows += [
+        ('attribute', attribute_value(key_id, value_id), count)
+        for key_id, value_id, count in attributes.order_by().filter(product__in=products.values('pk'))
+        .values_list('key_id', 'value_id').annotate(count=Count('product_id', distinct=True))
+    ]
+    return rows
+
+
+def rebuild(category_ids=None):
+    """Recompute the stored counts of the given (or all) categories."""
+    if category_ids is None:
+        category_ids = list(Category.objects.values_list('pk', flat=True))
+    FacetCount.objects.filter(category_id__in=category_ids).delete()
+    created = 0
+    for category_id in category_ids:
+        rows = count_rows(Product.objects.filter(category_id=category_id))
+        created += len(FacetCount.objects.bulk_create([
+            FacetCount(category_id=category_id, facet=facet, value=value, count=count)
+            for facet, value, count in rows
+        ], batch_size=1000))
+    return created
+
+
+def stored_rows(category_id):
+    return FacetCount.objects.filter(category_id=category_id, count__gt=0).values_list('facet', 'value', 'count')
+
+
+def as_response(rows):
+    """Group facet rows and add brand, attribute key and value titles."""
+    rows = [(facet, value, count) for facet, value, count in rows if count > 0]
+    brand_ids = [int(value) for facet, value, count in rows if facet == 'brand']
+    pairs = [tuple(map(int, value.split(':'))) for facet, value, count in rows if facet == 'attribute']
+    brands = dict(Brand.objects.filter(pk__in=brand_ids).values_list('pk', 'title')) if brand_ids else {}
+    keys = dict(AttributeKey.objects.filter(pk__in={k for k, v in pairs}).values_list('pk', 'key')) if pairs else {}
+    values = dict(AttributeValue.objects.filter(pk__in={v for k, v in pairs}).values_list('pk', 'value')) if pairs else {}
+
+    result = {'brand': [], 'price': [], 'attributes': []}
+    for facet, value, count in rows:
+        if facet == 'brand':
+            result['brand'].append({'id': int(value), 'title': brands.get(int(value)), 'count': count})
+        elif facet == 'price':
+            result['price'].append({'range': value, 'count': count})
+        else:
+            key_id, value_id = map(int, value.split(':'))
+            result['attributes'].append({'key': keys.get(key_id), 'value': values.get(value_id), 'count': count})
+
+    result['brand'].sort(key=lambda item: (-item['count'], item['id']))
+    result['price'].sort(key=lambda item: BAND_LABELS.index(item['range']))
+    result['attributes'].sort(key=lambda item: (str(item['key']), -item['count'], str(item['value'])))
+    return result
@@ -0,0 +1,65 @@
+from collections import defaultdict
+
+from django_filters import rest_framework as django_filters
+from rest_framework import filters
+
+from olcha.models import Product, ProductAttribute
+from olcha.search import get_backend
+
+
+class ProductFilter(django_filters.FilterSet):
+    final_price_min = django_filters.NumberFilter(field_name='final_price', lookup_expr='gte')
+    final_price_max = django_filters.NumberFilter(field_name='final_price', lookup_expr='lte')
+
+    class Meta:
+        model = Product
+        fields = ['category', 'brand', 'price']
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter backed by the full-text index in olcha.search. Matching
+    products are annotated with `search_rank` (lower is better). The match is
+    a subquery of the filtered queryset and has no cap, so count, pagination,
+    filters, orderings and the export all see every matching product.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        backend = get_backend()
+        if not terms or backend is None:
+            return super().filter_queryset(request, queryset, view)
+        return backend.filter(queryset, ' '.join(terms))
+
+
+class ProductOrderingFilter(filters.OrderingFilter):
+    """Orders search results by relevance unless an ordering is requested."""
+
+    def get_ordering(self, request, queryset, view):
+        if self.ordering_param not in request.query_params and 'search_rank' in queryset.query.annotations:
+            return ['search_rank', 'pk']
+        return super().get_ordering(request, queryset, view)
+
+
+class ProductAttributeFilter(filters.BaseFilterBackend):
+    """
+    Filters products by attributes given as `?attribute=RAM:8GB&attribute=color:black`.
+    Values of the same key are OR-ed, different keys are AND-ed. Every key
+    becomes one `pk IN (...)` subquery served by the (key, value, product)
+    index of ProductAttribute.
+    """
+    attribute_param = 'attribute'
+
+    def get_conditions(self, request):
+        conditions = defaultdict(set)
+        for param in request.query_params.getlist(self.attribute_param):
+            key, separator, value = param.partition(':')
+            if separator and key.strip() and value.strip():
+                conditions[key.strip()].add(value.strip())
+        return conditions
+
+    def filter_queryset(self, request, queryset, view):
+        for key, values in self.get_conditions(request).items():
+            product_ids = ProductAttribute.objects.filter(key__key=key, value__value__in=values).values('product_id')
+            queryset = queryset.filter(pk__in=product_ids)
+        return queryset
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from olcha.benchmark import p50_p95
+from olcha.filters import ProductAttributeFilter
+from olcha.models import Product, ProductAttribute
+
+
+class Command(BaseCommand):
+    help = ("Time product listings filtered by 1, 2 and 3 attribute keys, using the most "
+            "common attribute values of the current catalog.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=100)
+
+    def handle(self, *args, **options):
+        common = ProductAttribute.objects.order_by() \
+            .values_list('key__key', 'value__value').annotate(count=Count('pk')).order_by('-count')[:50]
+        by_key = {}
+        for key, value, count in common:
+            by_key.setdefault(key, []).append(value)
+        if not by_key:
+            raise CommandError("The catalog has no product attributes.")
+
+        keys = list(by_key)[:3]
+        self.stdout.write(f"{Product.objects.count()} products, {ProductAttribute.objects.count()} attributes\n")
+        for size in range(1, len(keys) + 1):
+            params = [f'{key}:{value}' for key in keys[:size] for value in by_key[key][:2]]
+            request = Request(RequestFactory().get('/', {'attribute': params}))
+            queryset = ProductAttributeFilter().filter_queryset(request, Product.objects.order_by('pk'), None)
+
+            found = list(queryset.values_list('pk', flat=True)[:options['limit']])
+            p50, p95 = p50_p95(lambda: list(queryset.values_list('pk', flat=True)[:options['limit']]),
+                               options['repeat'])
+            self.stdout.write(f"{size} key(s) {params}: {len(found)} rows  p50 {p50:.2f} ms  p95 {p95:.2f} ms")
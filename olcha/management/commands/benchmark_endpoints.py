@@ -0,0 +1,264 @@
+import json
+import os
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import get_resolver, resolve, reverse, Resolver404
+
+from olcha import caching
+from olcha.benchmark import percentile
+from olcha.models import Product
+from users.models import CustomUser
+
+NAMESPACES = ['olcha', 'users']
+PASSWORD = 'benchmark-password'
+
+
+def endpoint_names():
+    """Every named URL of the olcha and users url configs, e.g. `olcha:products-list`."""
+    resolver = get_resolver()
+    return sorted(
+        f'{namespace}:{name}'
+        for namespace in NAMESPACES
+        for name in resolver.namespace_dict[namespace][1].reverse_dict
+        if isinstance(name, str)
+    )
+
+
+def request(name, method='get', args=(), data=None, query=None, user=True, headers=None):
+    path = reverse(name, args=args)
+    if query:
+        path += '?' + urlencode(query)
+    return {'name': name, 'method': method, 'path': path, 'body': data, 'user': user, 'headers': headers or {}}
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the API in-process with the test client: every endpoint of olcha/urls.py and "
+            "users/urls.py, or the requests of a JSONL log (--replay). Reports p50/p95/p99 latency, "
+            "requests/s and queries per request, and compares them with a baseline file. Everything runs "
+            "in a transaction that is rolled back, so the database is left unchanged.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="measured rounds")
+        parser.add_argument('--warmup', type=int, default=2, help="unmeasured rounds run first")
+        parser.add_argument('--replay', help="JSONL file, one request per line: "
+                                             '{"method": "GET", "path": "/olcha/products/", "body": {...}, '
+                                             '"headers": {...}, "user": true}; "user" sends it logged in')
+        parser.add_argument('--cold', action='store_true', help="clear the cache before every request")
+        parser.add_argument('--baseline', help="JSON file with the results to compare with")
+        parser.add_argument('--save-baseline', action='store_true', help="write the results to --baseline")
+        parser.add_argument('--threshold', type=float, default=25.0,
+                            help="p50 slowdown in percent reported as a regression")
+        parser.add_argument('--check', action='store_true', help="fail when there is a regression")
+
+    def handle(self, *args, **options):
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError("--save-baseline needs --baseline.")
+        if options['replay']:
+            with open(options['replay'], encoding='utf-8') as file:
+                self.log = [json.loads(line) for line in file if line.strip()]
+        else:
+            self.log = None
+
+        # DEBUG=False: production-like, no query log and no debug toolbar
+        with override_settings(DEBUG=False), transaction.atomic():
+            results, elapsed = self.run(options)
+            transaction.set_rollback(True)
+        # keshda bekor qilingan yozuvlardan qurilgan javoblar qolmasin
+        caching.bump(caching.CATALOG, caching.PRODUCTS, caching.BRANDS, caching.CATEGORIES, caching.CATEGORY_GROUPS)
+
+        baseline = {}
+        if options['baseline'] and os.path.exists(options['baseline']) and not options['save_baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)['endpoints']
+        regressions = self.report(results, elapsed, baseline, options['threshold'])
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump({'endpoints': results}, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f"Baseline written to {options['baseline']}.")
+        if regressions and options['check']:
+            raise CommandError(f"{len(regressions)} endpoints regressed: {', '.join(regressions)}")
+
+    def run(self, options):
+        self.user = CustomUser.objects.filter(username='benchmark').first() or \
+            CustomUser.objects.create_user(username='benchmark', phone_number='+998330000001', password=PASSWORD)
+        self.user.is_staff = True
+        self.user.set_password(PASSWORD)
+        self.user.save()
+        self.anonymous = Client()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.queries = 0
+
+        if self.log is None:
+            self.product = Product.objects.filter(brand__isnull=False).select_related('category__groups', 'brand') \
+                .order_by('-rating_count', 'pk').first()
+            if self.product is None:
+                raise CommandError("The catalog has no products, run generate_catalog first.")
+
+        timings, queries, statuses = defaultdict(list), defaultdict(int), defaultdict(lambda: defaultdict(int))
+        elapsed = 0.0
+        with connection.execute_wrapper(self.count_query):
+            # manfiy raqamli raundlar isinish uchun, o'lchanmaydi
+            for number in range(-options['warmup'], options['repeat']):
+                started = time.perf_counter()
+                for name, duration, count, status in self.round(number, options['cold']):
+                    if number >= 0:
+                        timings[name].append(duration)
+                        queries[name] += count
+                        statuses[name][status] += 1
+                if number >= 0:
+                    elapsed += time.perf_counter() - started
+
+        results = {}
+        for name, measured in timings.items():
+            measured.sort()
+            results[name] = {
+                'requests': len(measured),
+                'p50': round(percentile(measured, 50), 3),
+                'p95': round(percentile(measured, 95), 3),
+                'p99': round(percentile(measured, 99), 3),
+                'rps': round(len(measured) / (sum(measured) / 1000), 1),
+                'queries': round(queries[name] / len(measured), 2),
+                'status': {str(status): count for status, count in sorted(statuses[name].items())},
+            }
+        return results, elapsed
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def round(self, number, cold):
+        """Perform one round of requests, yielding (name, ms, queries, status) for each."""
+        requests = self.replay() if self.log is not None else self.scenario(number)
+        response = None
+        while True:
+            try:
+                spec = requests.send(response)
+            except StopIteration:
+                return
+            if cold:
+                cache.clear()
+            response, duration, count = self.perform(spec)
+            yield spec.get('name') or self.endpoint_name(spec['path']), duration, count, response.status_code
+
+    def replay(self):
+        for spec in self.log:
+            yield spec
+
+    def perform(self, spec):
+        client = self.client if spec.get('user') else self.anonymous
+        body = spec.get('body')
+        data = json.dumps(body) if body is not None else ''
+        queries = self.queries
+        start = time.perf_counter()
+        response = client.generic(spec.get('method', 'GET').upper(), spec['path'], data,
+                                  content_type='application/json', headers=spec.get('headers') or {})
+        if response.streaming:
+            b''.join(response.streaming_content)
+        duration = (time.perf_counter() - start) * 1000
+        return response, duration, self.queries - queries
+
+    def endpoint_name(self, path):
+        try:
+            return resolve(urlsplit(path).path).view_name
+        except Resolver404:
+            return path
+
+    def scenario(self, number):
+        """
+        One request to every endpoint, in an order where the writes build on
+        each other: the cart is filled and checked out, a comment is created,
+        edited and deleted, a new user registers and logs in and out.
+        """
+        product, user = self.product, self.user
+        category, brand = product.category, product.brand
+
+        yield request('olcha:api-root', user=False)
+        yield request('olcha:category-groups-list', user=False)
+        yield request('olcha:category-groups-detail', args=[category.groups.slug], user=False)
+        yield request('olcha:categories-list', user=False)
+        yield request('olcha:categories-detail', args=[category.slug], user=False)
+        yield request('olcha:brands-list', user=False)
+        yield request('olcha:brands-detail', args=[brand.slug], user=False)
+        yield request('olcha:products-list', user=False)
+        yield request('olcha:products-list', query={'category': category.pk, 'ordering': '-final_price'}, user=False)
+        yield request('olcha:products-list', query={'search': product.title.split()[-1]}, user=False)
+        yield request('olcha:products-detail', args=[product.pk], user=False)
+        yield request('olcha:products-facets', query={'category': category.pk}, user=False)
+        yield request('olcha:products-export', query={'category': category.pk, 'brand': brand.pk})
+
+        added = yield request('olcha:cart-add-to-cart', 'post', data={'pk': product.pk, 'quantity': 1})
+        item = added.json()['id']
+        yield request('olcha:cart-update-product-quantity', 'patch', args=[item], data={'quantity': 2})
+        others = list(Product.objects.filter(category=category).exclude(pk=product.pk).values_list('pk', flat=True)[:3])
+        yield request('olcha:cart-batch', 'post', data={'operations': [
+            {'op': 'add', 'product': pk, 'quantity': 1} for pk in others
+        ] + [{'op': 'set', 'product': product.pk, 'quantity': 3}]})
+        yield request('olcha:cart-list')
+        yield request('olcha:cart-detail', args=[item])
+        checkout = yield request('olcha:cart-checkout', 'post')
+        order = checkout.json()['id']
+        yield request('olcha:orders-list')
+        yield request('olcha:orders-detail', args=[order])
+        added = yield request('olcha:cart-add-to-cart', 'post', data={'pk': product.pk, 'quantity': 1})
+        yield request('olcha:cart-remove-from-cart', 'delete', args=[added.json()['id']])
+        yield request('olcha:cart-clear-cart', 'delete')
+
+        yield request('olcha:comments-list', user=False)
+        created = yield request('olcha:comments-list', 'post', data={
+            'product': product.pk, 'user': user.pk, 'rating': 5, 'text': 'benchmark'})
+        comment = created.json()['id']
+        yield request('olcha:comments-detail', args=[comment], user=False)
+        yield request('olcha:comments-detail', 'patch', args=[comment], data={'rating': 4})
+        yield request('olcha:comments-detail', 'delete', args=[comment])
+
+        yield request('users:api-root')
+        yield request('users:profiles-list')
+        yield request('users:profiles-detail', args=[user.profile.pk])
+        yield request('users:register', 'post', user=False, data={
+            'username': f'benchmark_{number}', 'phone_number': f'+99833{number + 1000:07d}',
+            'password': PASSWORD, 'confirm_password': PASSWORD})
+        tokens = yield request('users:login', 'post', user=False, data={'username': user.username, 'password': PASSWORD})
+        tokens = yield request('users:token_refresh', 'post', user=False, data={'refresh': tokens.json()['refresh']})
+        yield request('users:logout', 'post', data={'refresh': tokens.json()['refresh']})
+
+    def report(self, results, elapsed, baseline, threshold):
+        regressions = []
+        self.stdout.write(f"{'endpoint':<38} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} "
+                          f"{'queries':>7}  status")
+        for name, result in sorted(results.items()):
+            line = (f"{name:<38} {result['requests']:>5} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+                    f"{result['p99']:>8.2f} {result['rps']:>8.1f} {result['queries']:>7.1f}  "
+                    f"{' '.join(f'{status}x{count}' for status, count in result['status'].items())}")
+            previous = baseline.get(name)
+            if previous:
+                change = (result['p50'] / previous['p50'] - 1) * 100 if previous['p50'] else 0.0
+                line += f"  p50 {change:+.0f}%"
+                if result['queries'] != previous['queries']:
+                    line += f"  queries {previous['queries']:g} -> {result['queries']:g}"
+                # keshlangan endpointlarda o'rtacha so'rovlar soni biroz o'zgarib turadi,
+                # N+1 yoki ishlamay qolgan kesh esa har so'rovga kamida bittadan qo'shadi
+                if change > threshold or result['queries'] >= previous['queries'] + 1:
+                    regressions.append(name)
+                    line += '  REGRESSION'
+            self.stdout.write(line)
+
+        total = sum(result['requests'] for result in results.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} requests in {elapsed:.2f}s, {total / max(elapsed, 1e-9):.0f} requests/s."
+        ))
+        if self.log is None:
+            missing = sorted(set(endpoint_names()) - set(results))
+            if missing:
+                self.stdout.write(self.style.WARNING(f"Endpoints without a benchmark: {', '.join(missing)}"))
+        if regressions:
+            self.stdout.write(self.style.ERROR(f"Regressions against the baseline: {', '.join(regressions)}"))
+        return regressions
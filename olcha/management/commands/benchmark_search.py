@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from olcha.benchmark import p50_p95
+from olcha.models import Product
+from olcha.search import get_backend, search_terms
+
+
+class Command(BaseCommand):
+    help = ("Compare full-text search latency with the old icontains search on the current "
+            "catalog. Generate a large catalog first to see realistic numbers.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', default=['phone', 'samsung galaxy', 'black 128'])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=100)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            raise CommandError("The database has no full-text search backend.")
+
+        limit = options['limit']
+        self.stdout.write(f"{Product.objects.count()} products, {options['repeat']} runs per query\n")
+        for query in options['terms']:
+            like = Q()
+            for term in search_terms(query):
+                like &= Q(title__icontains=term) | Q(description__icontains=term) \
+                    | Q(brand__title__icontains=term) | Q(category__title__icontains=term)
+
+            # API dagi kabi: relevance bo'yicha tartiblangan birinchi sahifa
+            fts = p50_p95(lambda: list(backend.filter(Product.objects.all(), query).order_by('search_rank', 'pk')
+                                       .values_list('pk', flat=True)[:limit]), options['repeat'])
+            icontains = p50_p95(lambda: list(Product.objects.filter(like).values_list('pk', flat=True)[:limit]),
+                                options['repeat'])
+            self.stdout.write(f"{query!r:>20}  full-text p50 {fts[0]:8.2f} ms  p95 {fts[1]:8.2f} ms   "
+                              f"icontains p50 {icontains[0]:8.2f} ms  p95 {icontains[1]:8.2f} ms")
+
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from olcha.benchmark import p50_p95
+from olcha.models import Product
+from olcha.serializers import ProductSerializer, ProductFastSerializer
+from olcha.views import attributes_prefetch
+
+
+class Command(BaseCommand):
+    help = ("Time ProductSerializer against ProductFastSerializer (query + serialize + render) "
+            "for pages of 100, 1000 and 10000 products of the current catalog.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int, default=[100, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        total = Product.objects.count()
+        if not total:
+            raise CommandError("The catalog is empty.")
+
+        fast = ProductFastSerializer()
+        renderer = JSONRenderer()
+        self.stdout.write(f"{total} products, {options['repeat']} runs per size\n")
+        for size in options['sizes']:
+            products = Product.objects.order_by('pk')[:size]
+            rows = min(size, total)
+            serializer = p50_p95(lambda: renderer.render(
+                ProductSerializer(products.prefetch_related(attributes_prefetch()), many=True).data
+            ), options['repeat'])
+            values = p50_p95(lambda: renderer.render(fast.serialize(fast.rows(products))), options['repeat'])
+            self.stdout.write(f"{rows:>6} rows  serializer p50 {serializer[0]:9.2f} ms  p95 {serializer[1]:9.2f} ms   "
+                              f"fast p50 {values[0]:9.2f} ms  p95 {values[1]:9.2f} ms   "
+                              f"x{serializer[0] / values[0]:.1f}")
+
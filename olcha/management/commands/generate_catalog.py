@@ -0,0 +1,244 @@
+import random
+import time
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from olcha import caching, facets
+from olcha.models import (CategoryGroup, Category, Brand, Product, AttributeKey, AttributeValue, ProductAttribute,
+                          Comment, Favorite, Cart, CartItem, Order, OrderItem)
+from olcha.search import get_backend
+from users.models import CustomUser, Profile
+
+GROUPS = ['Electronics', 'Computers', 'Home appliances', 'Kitchen', 'Beauty', 'Sports', 'Kids', 'Auto',
+          'Garden', 'Books', 'Fashion', 'Health']
+NOUNS = ['phone', 'laptop', 'tablet', 'watch', 'headphones', 'speaker', 'monitor', 'camera', 'router', 'printer',
+         'kettle', 'blender', 'vacuum', 'iron', 'heater', 'fan', 'bike', 'ball', 'lamp', 'chair']
+MODELS = ['Pro', 'Max', 'Lite', 'Plus', 'Ultra', 'Mini', 'Air', 'Neo', 'Prime', 'Edge', 'Galaxy', 'Nova']
+COLORS = ['black', 'white', 'silver', 'blue', 'red', 'green', 'gold', 'gray']
+ATTRIBUTE_KEYS = ['Color', 'RAM', 'Storage', 'Screen', 'Weight', 'Power', 'Material', 'Warranty', 'Size',
+                  'Battery', 'Processor', 'Country', 'Volume', 'Speed', 'Resolution', 'Connectivity']
+WORDS = ['fast', 'quiet', 'compact', 'durable', 'wireless', 'smart', 'energy', 'saving', 'premium', 'original',
+         'official', 'warranty', 'delivery', 'new', 'model', 'year', 'stylish', 'light', 'powerful', 'reliable']
+RATING_WEIGHTS = list(accumulate([4, 4, 10, 30, 52]))
+ORDER_STATUSES = ['successful', 'pending', 'failed']
+ORDER_STATUS_WEIGHTS = list(accumulate([80, 12, 8]))
+
+
+def zipf(n, exponent=1.1):
+    """Cumulative weights where rank i is chosen ~1/i**exponent as often as rank 1."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+class Command(BaseCommand):
+    help = ("Generate a reproducible synthetic catalog (categories, brands, products, attributes, users with "
+            "profiles, comments, favorites, carts and orders) with skewed distributions, for benchmarks. Rows are written with "
+            "batched bulk inserts, so no signals run; ratings, facet counts, order totals and the search "
+            "index are filled in directly and the caches are invalidated once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='Gen', help="prefix of generated titles and usernames")
+        parser.add_argument('--categories', type=int, help="defaults to products / 2000 (10..500)")
+        parser.add_argument('--brands', type=int, help="defaults to products / 500 (20..5000)")
+        parser.add_argument('--users', type=int, help="defaults to products / 10 (100..200000)")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        products = options['products']
+        categories = options['categories'] or min(max(products // 2000, 10), 500)
+        brands = options['brands'] or min(max(products // 500, 20), 5000)
+        users = options['users'] or min(max(products // 10, 100), 200000)
+
+        if Category.objects.filter(title__startswith=f'{self.prefix} ').exists():
+            raise CommandError(f"A catalog with prefix {self.prefix!r} exists already, use another --prefix.")
+
+        start = time.monotonic()
+        with transaction.atomic():
+            self.make_taxonomy(categories, brands)
+            self.make_users(users)
+        self.report('categories, brands, attributes and users', start)
+
+        step = time.monotonic()
+        self.product_ids = []
+        for offset in range(0, products, self.batch_size):
+            with transaction.atomic():
+                self.make_products(offset, min(self.batch_size, products - offset))
+        self.report(f'{products} products with attributes and comments', step)
+
+        step = time.monotonic()
+        with transaction.atomic():
+            self.make_favorites_and_carts()
+            self.make_orders()
+        self.report('favorites, carts and orders', step)
+
+        step = time.monotonic()
+        with transaction.atomic():
+            backend = get_backend()
+            if backend is not None:
+                backend.create()
+                backend.reindex()
+            facets.rebuild(self.category_ids)
+        caching.bump(caching.CATALOG, caching.PRODUCTS, caching.BRANDS, caching.CATEGORIES, caching.CATEGORY_GROUPS)
+        self.report('search index and facet counts', step)
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {products} products in {elapsed:.1f}s, {products / max(elapsed, 1e-9):.0f} products/s."
+        ))
+
+    def report(self, what, start):
+        self.stdout.write(f"{what}: {time.monotonic() - start:.1f}s")
+
+    def bulk(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def insert(self, model, fields, rows):
+        """
+        executemany() INSERT of plain tuples, for the big tables whose ids are not
+        needed. bulk_create would build a model instance and prepare every value
+        through its field, which is most of the generation time.
+        """
+        stamps = [field.attname for field in model._meta.concrete_fields if field.attname in ('created_at', 'updated_at')]
+        now = (connection.ops.adapt_datetimefield_value(timezone.now()),) * len(stamps)
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields + stamps)
+        sql = (f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+               f'VALUES ({", ".join(["%s"] * (len(fields) + len(stamps)))})')
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, [row + now for row in rows[start:start + self.batch_size]])
+
+    def make_taxonomy(self, categories, brands):
+        rng = self.rng
+        groups = self.bulk(CategoryGroup, [
+            CategoryGroup(title=f'{self.prefix} {title}', slug=f'{self.prefix}-{title}'.lower().replace(' ', '-'),
+                          image='category_groups/generated.png')
+            for title in GROUPS
+        ])
+        self.category_ids = [category.pk for category in self.bulk(Category, [
+            Category(title=f'{self.prefix} {NOUNS[i % len(NOUNS)]} {i}', slug=f'{self.prefix}-{NOUNS[i % len(NOUNS)]}-{i}'.lower(),
+                     image='category/generated.png', groups=groups[i % len(groups)])
+            for i in range(categories)
+        ])]
+        self.brand_ids = [brand.pk for brand in self.bulk(Brand, [
+            Brand(title=f'{self.prefix} Brand {i}', slug=f'{self.prefix}-brand-{i}'.lower(), logo='brands/generated.png')
+            for i in range(brands)
+        ])]
+        self.category_weights = zipf(categories, 0.8)
+        self.brand_weights = zipf(brands, 1.2)
+
+        keys = self.bulk(AttributeKey, [AttributeKey(key=f'{self.prefix} {key}') for key in ATTRIBUTE_KEYS])
+        self.values = {}
+        for key in keys:
+            name = key.key.split(' ', 1)[1]
+            self.values[key.pk] = [value.pk for value in self.bulk(AttributeValue, [
+                AttributeValue(value=f'{self.prefix} {name} {i}') for i in range(20)
+            ])]
+        self.value_weights = zipf(20, 1.0)
+        # har bir kategoriyaning o'z atributlari bor
+        self.category_keys = {category_id: rng.sample([key.pk for key in keys], rng.randint(3, 8))
+                              for category_id in self.category_ids}
+
+    def make_users(self, users):
+        password = make_password(None)
+        # generatsiya qilingan userlar +99877 raqamlarini oladi
+        first = CustomUser.objects.filter(phone_number__startswith='+99877').count()
+        self.user_ids = [user.pk for user in self.bulk(CustomUser, [
+            CustomUser(username=f'{self.prefix.lower()}_user_{i}', phone_number=f'+99877{first + i:07d}', password=password)
+            for i in range(users)
+        ])]
+        # bulk_create create_user_profile signalini chaqirmaydi
+        self.insert(Profile, ['user'], [(user_id,) for user_id in self.user_ids])
+        self.user_weights = zipf(users, 0.9)
+
+    def make_products(self, offset, size):
+        rng = self.rng
+        categories = rng.choices(self.category_ids, cum_weights=self.category_weights, k=size)
+        brands = rng.choices(self.brand_ids, cum_weights=self.brand_weights, k=size)
+        products, histograms = [], []
+        for i, category_id, brand_id in zip(range(offset, offset + size), categories, brands):
+            noun, model, color = rng.choice(NOUNS), rng.choice(MODELS), rng.choice(COLORS)
+            price = Decimal(f'{max(rng.lognormvariate(5.5, 1.4), 1):.2f}')
+            discount = rng.choice([0] * 6 + [5, 10, 15, 20, 30, 50])
+            # ko'p productda sharh yo'q, bir nechtasida yuzlab
+            comments = min(int(rng.paretovariate(1.5)) - 1, 300)
+            ratings = rng.choices(range(1, 6), cum_weights=RATING_WEIGHTS, k=comments)
+            histogram = [ratings.count(stars) for stars in range(1, 6)]
+            histograms.append(ratings)
+            products.append(Product(
+                title=f'{self.prefix} {model} {noun} {rng.choice([64, 128, 256, 512])}GB {color} #{i}',
+                description=' '.join(rng.choices(WORDS, k=rng.randint(5, 30))) + f' {noun} {color}',
+                price=price, discount=discount, category_id=category_id,
+                brand_id=None if rng.random() < 0.05 else brand_id,
+                rating_count=comments,
+                avg_rating=round(sum(stars * n for stars, n in zip(range(1, 6), histogram)) / comments, 2) if comments else None,
+                **{f'rating_{stars}': n for stars, n in zip(range(1, 6), histogram)},
+            ))
+        products = self.bulk(Product, products)
+
+        attributes, comments = [], []
+        for product, ratings in zip(products, histograms):
+            self.product_ids.append(product.pk)
+            for key_id in self.category_keys[product.category_id]:
+                if rng.random() < 0.8:
+                    value_id = rng.choices(self.values[key_id], cum_weights=self.value_weights)[0]
+                    attributes.append((product.pk, key_id, value_id))
+            for rating in ratings:
+                user_id = rng.choices(self.user_ids, cum_weights=self.user_weights)[0]
+                comments.append((product.pk, user_id, rating, ' '.join(rng.choices(WORDS, k=rng.randint(3, 20)))))
+        self.insert(ProductAttribute, ['product', 'key', 'value'], attributes)
+        self.insert(Comment, ['product', 'user', 'rating', 'text'], comments)
+
+    def popular_products(self, k):
+        # oldin yaratilgan productlar ko'proq sotiladi
+        return self.rng.choices(self.product_ids, cum_weights=self.product_weights, k=k)
+
+    def make_favorites_and_carts(self):
+        rng = self.rng
+        self.product_weights = zipf(len(self.product_ids), 0.7)
+        favorites, carts = [], []
+        for user_id in self.user_ids:
+            for product_id in set(self.popular_products(rng.choice([0, 0, 1, 2, 3, 5, 10]))):
+                favorites.append((user_id, product_id))
+            if rng.random() < 0.3:
+                carts.append(Cart(user_id=user_id))
+        self.insert(Favorite, ['user', 'product'], favorites)
+
+        items = []
+        for cart in self.bulk(Cart, carts):
+            for product_id in set(self.popular_products(rng.randint(1, 6))):
+                items.append((cart.pk, product_id, rng.choice([1, 1, 1, 2, 3])))
+        self.insert(CartItem, ['cart', 'product', 'quantity'], items)
+
+    def make_orders(self):
+        rng = self.rng
+        orders, lines = [], []
+        for user_id in self.user_ids:
+            if rng.random() < 0.6:
+                continue
+            for _ in range(min(int(rng.paretovariate(1.3)), 50)):
+                products = set(self.popular_products(rng.randint(1, 5)))
+                lines.append([(product_id, rng.choice([1, 1, 2, 3])) for product_id in products])
+                orders.append(Order(user_id=user_id, status=rng.choices(ORDER_STATUSES, cum_weights=ORDER_STATUS_WEIGHTS)[0]))
+
+        ordered = sorted({product_id for items in lines for product_id, quantity in items})
+        prices = {}
+        for start in range(0, len(ordered), 900):
+            prices.update(Product.objects.filter(pk__in=ordered[start:start + 900]).values_list('pk', 'final_price'))
+        for order, items in zip(orders, lines):
+            order.total = sum(prices[product_id] * quantity for product_id, quantity in items)
+            order.item_count = sum(quantity for product_id, quantity in items)
+
+        self.insert(OrderItem, ['order', 'product', 'quantity', 'price_when_ordered'], [
+            (order.pk, product_id, quantity, prices[product_id])
+            for order, items in zip(self.bulk(Order, orders), lines)
+            for product_id, quantity in items
+        ])
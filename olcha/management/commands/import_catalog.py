@@ -0,0 +1,350 @@
+import codecs
+import csv
+import io
+import json
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from olcha import caching, facets
+from olcha.models import CategoryGroup, Category, Brand, Product, AttributeKey, AttributeValue, ProductAttribute
+from olcha.search import get_backend
+
+PRODUCT_FIELDS = ['description', 'price', 'discount', 'category', 'brand', 'updated_at']
+# `dumpdata` attribute records, resolved through the fixture's own pks
+ATTRIBUTE_MODELS = ['olcha.attributekey', 'olcha.attributevalue', 'olcha.productattribute']
+# `dumpdata` catalog records, matched by title or created, and also resolved through the fixture's pks
+CATALOG_MODELS = {'olcha.categorygroup': CategoryGroup, 'olcha.category': Category, 'olcha.brand': Brand}
+
+
+def open_text(path, encoding=None):
+    """Open a file as text, detecting UTF-8/UTF-16 byte order marks."""
+    raw = open(path, 'rb')
+    if encoding is None:
+        start = raw.peek(4)[:4] if hasattr(raw, 'peek') else b''
+        if start.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            encoding = 'utf-16'
+        else:
+            encoding = 'utf-8-sig'
+    return io.TextIOWrapper(raw, encoding=encoding, newline='')
+
+
+def read_json(stream, chunk_size=64 * 1024):
+    """Yield the items of a top level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer:
+                raise CommandError("JSON input must be an array of products.")
+        else:
+            if buffer.startswith(','):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith(']'):
+                return
+            if buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise CommandError("Invalid JSON input.")
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            raise CommandError("Unexpected end of JSON input.")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    """CSV rows, `attr:<key>` columns become attributes."""
+    for row in csv.DictReader(stream):
+        attributes = {column[5:]: value for column, value in row.items() if column.startswith('attr:') and value}
+        record = {column: value for column, value in row.items() if not column.startswith('attr:')}
+        record['attributes'] = attributes
+        yield record
+
+
+READERS = {
+    'json': read_json,
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+class Command(BaseCommand):
+    help = ("Stream products from a JSON array, NDJSON or CSV file into the catalog with batched "
+            "bulk inserts/updates. Products are matched by title; categories and brands by id, "
+            "title or slug, so they have to exist already. In `dumpdata` files the category group, "
+            "category and brand records (listed before the products, as dumpdata does) are matched "
+            "by title or created, and the olcha.productattribute records are imported too; other "
+            "models are counted and ignored. Product signals are skipped and caches, search index "
+            "and facets are refreshed once at the end.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(READERS), help="defaults to the file extension")
+        parser.add_argument('--encoding', help="defaults to UTF-8, or UTF-16 when the file has a BOM")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-brands', action='store_true', help="create brands that do not exist yet")
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format.")
+
+        self.create_brands = options['create_brands']
+        self.categories = self.id_map(Category)
+        self.brands = self.id_map(Brand)
+        self.keys = dict(AttributeKey.objects.values_list('key', 'pk'))
+        self.values = dict(AttributeValue.objects.values_list('value', 'pk'))
+        self.touched_categories = set()
+        self.created = self.updated = 0
+        self.skipped = Counter()
+        self.ignored = Counter()
+        # fixture pk -> title/key/value or database pk, and (product, key, value) pks of productattribute records
+        self.fixture = {model: {} for model in ['olcha.product', 'olcha.attributekey', 'olcha.attributevalue',
+                                                *CATALOG_MODELS]}
+        self.fixture_attributes = []
+        search = get_backend()
+
+        start = time.monotonic()
+        with open_text(options['path'], options['encoding']) as stream:
+            batch = []
+            for record in READERS[file_format](stream):
+                # `dumpdata` fixtures such as data.json hold other models too
+                model = record.get('model', 'olcha.product')
+                if model in ATTRIBUTE_MODELS:
+                    self.collect(model, record)
+                    continue
+                if model in CATALOG_MODELS:
+                    self.resolve_catalog(model, record)
+                    continue
+                if model != 'olcha.product':
+                    self.ignored[model] += 1
+                    continue
+                product = self.parse(record)
+                if product is None:
+                    continue
+                if 'pk' in record:
+                    self.fixture['olcha.product'][record['pk']] = product['title']
+                batch.append(product)
+                if len(batch) >= options['batch_size']:
+                    self.write(batch, search)
+                    batch = []
+            if batch:
+                self.write(batch, search)
+        self.write_fixture_attributes(options['batch_size'])
+
+        with transaction.atomic():
+            facets.rebuild(sorted(self.touched_categories))
+        caching.bump(caching.CATALOG, caching.PRODUCTS, caching.BRANDS)
+
+        elapsed = time.monotonic() - start
+        total = self.created + self.updated
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total} products ({self.created} created, {self.updated} updated, "
+            f"{self.skipped['products']} skipped) in {elapsed:.1f}s, {total / max(elapsed, 1e-9):.0f} rows/s."
+        ))
+        if self.fixture_attributes:
+            self.stdout.write(f"{len(self.fixture_attributes) - self.skipped['attributes']} product attributes "
+                              f"imported, {self.skipped['attributes']} skipped.")
+        reasons = {reason: count for reason, count in self.skipped.items() if reason not in ('products', 'attributes')}
+        if reasons:
+            self.stdout.write(self.style.WARNING("Skipped: " + ', '.join(
+                f'{count} {reason}' for reason, count in sorted(reasons.items()))))
+        if self.ignored:
+            self.stdout.write("Ignored records: " + ', '.join(
+                f'{count} {model}' for model, count in sorted(self.ignored.items())))
+
+    def id_map(self, model):
+        ids = {}
+        for pk, title, slug in model.objects.values_list('pk', 'title', 'slug'):
+            ids.update({str(pk): pk, title: pk})
+            if slug:
+                ids[slug] = pk
+        return ids
+
+    def skip(self, reason):
+        self.skipped['products'] += 1
+        self.skipped[reason] += 1
+
+    def collect(self, model, record):
+        fields = record.get('fields', record)
+        if model == 'olcha.productattribute':
+            self.fixture_attributes.append((fields.get('product'), fields.get('key'), fields.get('value')))
+        else:
+            name = model.rsplit('.', 1)[1][len('attribute'):]
+            self.fixture[model][record.get('pk')] = str(fields.get(name, ''))
+
+    def resolve_catalog(self, model, record):
+        """The category group, category or brand of a `dumpdata` record, matched by title or created."""
+        fields = record.get('fields', {})
+        title = str(fields.get('title') or '').strip()
+        if not title:
+            self.skipped[f'{model} records without a title'] += 1
+            return
+        extra = {name: fields[name] for name in ['image', 'logo'] if name in fields}
+        if model == 'olcha.category':
+            extra['groups_id'] = self.fixture['olcha.categorygroup'].get(fields.get('groups'))
+            if extra['groups_id'] is None:
+                self.skipped['categories with an unknown group'] += 1
+                return
+        model_class = CATALOG_MODELS[model]
+        instance = model_class.objects.filter(title=title).first()
+        if instance is None:
+            instance = model_class.objects.create(title=title, slug=fields.get('slug') or None, **extra)
+        self.fixture[model][record.get('pk')] = instance.pk
+        ids = {str(instance.pk): instance.pk, instance.title: instance.pk}
+        if instance.slug:
+            ids[instance.slug] = instance.pk
+        if model == 'olcha.category':
+            self.categories.update(ids)
+        elif model == 'olcha.brand':
+            self.brands.update(ids)
+
+    def parse(self, record):
+        if 'fields' in record:
+            # `dumpdata` kategoriya va brend pk lari bazadagilariga almashtiriladi
+            record = dict(record['fields'])
+            for name in ['category', 'brand']:
+                pks = self.fixture[f'olcha.{name}']
+                if record.get(name) in pks:
+                    record[name] = pks[record[name]]
+
+        category = self.categories.get(str(record.get('category', '')).strip())
+        title = str(record.get('title') or '').strip()
+        try:
+            price = Decimal(str(record.get('price')))
+            discount = int(record.get('discount') or 0)
+        except (InvalidOperation, ValueError):
+            return self.skip('products with an invalid price or discount')
+        if not title:
+            return self.skip('products without a title')
+        if category is None:
+            return self.skip('products with an unknown category')
+
+        brand = record.get('brand')
+        brand = str(brand).strip() if brand not in (None, '') else None
+        if brand is not None and brand not in self.brands:
+            if not self.create_brands:
+                return self.skip('products with an unknown brand')
+            created = Brand.objects.create(title=brand, slug=slugify(brand))
+            self.brands.update({brand: created.pk, str(created.pk): created.pk, created.slug: created.pk})
+
+        attributes = record.get('attributes') or {}
+        if isinstance(attributes, list):
+            attributes = {item['key']: item['value'] for item in attributes}
+        return {
+            'title': title,
+            'description': record.get('description') or None,
+            'price': price,
+            'discount': discount,
+            'category': category,
+            'brand': self.brands[brand] if brand is not None else None,
+            'attributes': {str(key): str(value) for key, value in attributes.items()},
+        }
+
+    def resolve_attributes(self, batch):
+        keys = {key for product in batch for key in product['attributes']} - set(self.keys)
+        values = {value for product in batch for value in product['attributes'].values()} - set(self.values)
+        if keys:
+            AttributeKey.objects.bulk_create([AttributeKey(key=key) for key in keys], ignore_conflicts=True)
+            self.keys.update(AttributeKey.objects.filter(key__in=keys).values_list('key', 'pk'))
+        if values:
+            AttributeValue.objects.bulk_create([AttributeValue(value=value) for value in values], ignore_conflicts=True)
+            self.values.update(AttributeValue.objects.filter(value__in=values).values_list('value', 'pk'))
+
+    def write(self, batch, search):
+        # the same title twice in one batch: the last one wins
+        batch = list({product['title']: product for product in batch}.values())
+        now = timezone.now()
+        with transaction.atomic():
+            self.resolve_attributes(batch)
+            existing = {
+                title: (pk, category_id) for title, pk, category_id in
+                Product.objects.filter(title__in=[product['title'] for product in batch])
+                .values_list('title', 'pk', 'category_id')
+            }
+
+            new, changed = [], []
+            for product in batch:
+                instance = Product(
+                    title=product['title'], description=product['description'], price=product['price'],
+                    discount=product['discount'], category_id=product['category'], brand_id=product['brand'],
+                    updated_at=now,
+                )
+                self.touched_categories.add(product['category'])
+                if product['title'] in existing:
+                    instance.pk, old_category = existing[product['title']]
+                    self.touched_categories.add(old_category)
+                    changed.append(instance)
+                else:
+                    new.append(instance)
+
+            Product.objects.bulk_create(new)
+            Product.objects.bulk_update(changed, PRODUCT_FIELDS)
+            ids = {instance.title: instance.pk for instance in new + changed}
+            if not all(ids.values()):
+                # bazalar bulk_create dan keyin pk qaytarmasa
+                ids = dict(Product.objects.filter(title__in=list(ids)).values_list('title', 'pk'))
+
+            # _raw_delete: delete() would send post_delete for every attribute row
+            stale = ProductAttribute.objects.filter(product_id__in=[instance.pk for instance in changed])
+            stale._raw_delete(stale.db)
+            ProductAttribute.objects.bulk_create([
+                ProductAttribute(product_id=ids[product['title']], key_id=self.keys[key], value_id=self.values[value])
+                for product in batch for key, value in product['attributes'].items()
+            ])
+            if search:
+                search.reindex('products', list(ids.values()))
+
+        self.created += len(new)
+        self.updated += len(changed)
+
+    def write_fixture_attributes(self, batch_size):
+        """Attributes of `dumpdata` productattribute records, replacing those of their products."""
+        attributes = defaultdict(dict)
+        for product, key, value in self.fixture_attributes:
+            title = self.fixture['olcha.product'].get(product)
+            key = self.fixture['olcha.attributekey'].get(key)
+            value = self.fixture['olcha.attributevalue'].get(value)
+            if title is None or not key or not value:
+                # product o'tkazib yuborilgan yoki kalit/qiymat faylda yo'q
+                self.skipped['attributes'] += 1
+                continue
+            attributes[title][key] = value
+
+        titles = list(attributes)
+        for start in range(0, len(titles), batch_size):
+            batch = [{'attributes': attributes[title]} for title in titles[start:start + batch_size]]
+            with transaction.atomic():
+                self.resolve_attributes(batch)
+                ids = dict(Product.objects.filter(title__in=titles[start:start + batch_size]).values_list('title', 'pk'))
+                stale = ProductAttribute.objects.filter(product_id__in=list(ids.values()))
+                stale._raw_delete(stale.db)
+                ProductAttribute.objects.bulk_create([
+                    ProductAttribute(product_id=ids[title], key_id=self.keys[key], value_id=self.values[value])
+                    for title in titles[start:start + batch_size] for key, value in attributes[title].items()
+                ])
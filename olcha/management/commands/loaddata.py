@@ -0,0 +1,24 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.commands import loaddata
+
+from olcha.models import Brand, Category, Comment, Product, ProductAttribute
+from olcha.search import get_backend
+
+
+class Command(loaddata.Command):
+    help = ("Installs the named fixture(s) in the database. Fixture rows are saved raw, without the "
+            "signals that maintain the search index, the facet counts and the rating aggregates, so "
+            "these are rebuilt afterwards (rebuild_search_index, rebuild_facets, rebuild_ratings) "
+            "when the fixtures hold the rows they are computed from.")
+
+    def handle(self, *fixture_labels, **options):
+        super().handle(*fixture_labels, **options)
+        stdout = self.stdout if self.verbosity else StringIO()
+        if self.models & {Product, Brand, Category} and get_backend() is not None:
+            call_command('rebuild_search_index', stdout=stdout)
+        if self.models & {Product, ProductAttribute}:
+            call_command('rebuild_facets', stdout=stdout)
+        if self.models & {Product, Comment}:
+            call_command('rebuild_ratings', stdout=stdout)
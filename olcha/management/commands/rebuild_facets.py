@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from olcha import caching, facets
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored facet counts of every category."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = facets.rebuild()
+        caching.bump(caching.CATALOG)
+        self.stdout.write(self.style.SUCCESS(f"Stored {created} facet counts."))
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from olcha import caching
+from olcha.models import Product, Comment
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating aggregates of every product from its comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        histograms = defaultdict(dict)
+        rows = Comment.objects.order_by().values_list('product_id', 'rating').annotate(count=Count('id'))
+        for product_id, rating, count in rows.iterator():
+            histograms[product_id][rating] = count
+
+        fields = ['avg_rating', 'rating_count'] + [f'rating_{stars}' for stars in range(1, 6)]
+        products = Product.objects.only('pk').order_by('pk')
+        batch = []
+        updated = 0
+        with transaction.atomic():
+            for product in products.iterator(chunk_size=batch_size):
+                histogram = histograms.get(product.pk, {})
+                count = sum(histogram.values())
+                total = sum(stars * n for stars, n in histogram.items())
+                product.rating_count = count
+                product.avg_rating = round(total / count, 2) if count else None
+                for stars in range(1, 6):
+                    setattr(product, f'rating_{stars}', histogram.get(stars, 0))
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    updated += Product.objects.bulk_update(batch, fields)
+                    batch = []
+            if batch:
+                updated += Product.objects.bulk_update(batch, fields)
+
+        caching.bump(caching.CATALOG)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings of {updated} products."))
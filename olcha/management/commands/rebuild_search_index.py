@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from olcha import caching
+from olcha.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index from the catalog."
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            raise CommandError("The database has no full-text search backend.")
+        with transaction.atomic():
+            backend.create()
+            backend.reindex()
+        caching.bump(caching.PRODUCTS)
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:32
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_ratings(apps, schema_editor):
+    Comment = apps.get_model('olcha', 'Comment')
+    Product = apps.get_model('olcha', 'Product')
+    histograms = {}
+    rows = Comment.objects.order_by().values_list('product_id', 'rating').annotate(count=Count('id'))
+    for product_id, rating, count in rows:
+        histograms.setdefault(product_id, {})[rating] = count
+    for product_id, histogram in histograms.items():
+        count = sum(histogram.values())
+        total = sum(stars * n for stars, n in histogram.items())
+        Product.objects.filter(pk=product_id).update(
+            rating_count=count,
+            avg_rating=round(total / count, 2),
+            **{f'rating_{stars}': n for stars, n in histogram.items()},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0007_remove_cart_unique_user_cart_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# olcha.search dan nusxa: keyinchalik u o'zgarsa ham migratsiya o'zgarmaydi
+DOCUMENTS_SQL = '''
+    SELECT p.id, p.title, COALESCE(p.description, ''), COALESCE(b.title, ''), c.title
+    FROM olcha_product p
+    JOIN olcha_category c ON c.id = p.category_id
+    LEFT JOIN olcha_brand b ON b.id = p.brand_id
+'''
+
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS olcha_product_search USING fts5("
+        "title, description, brand, category, tokenize='unicode61 remove_diacritics 2')",
+        f'INSERT INTO olcha_product_search (rowid, title, description, brand, category) {DOCUMENTS_SQL}',
+    ],
+    'postgresql': [
+        'CREATE TABLE IF NOT EXISTS olcha_product_search (product_id bigint PRIMARY KEY, document tsvector NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS olcha_product_search_document ON olcha_product_search USING GIN (document)',
+        f'''
+        INSERT INTO olcha_product_search (product_id, document)
+        SELECT id,
+               setweight(to_tsvector('simple', title), 'A') ||
+               setweight(to_tsvector('simple', brand), 'B') ||
+               setweight(to_tsvector('simple', category), 'B') ||
+               setweight(to_tsvector('simple', description), 'C')
+        FROM ({DOCUMENTS_SQL}) AS documents (id, title, description, brand, category)
+        ''',
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute('DROP TABLE IF EXISTS olcha_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0008_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
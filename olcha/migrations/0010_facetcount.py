@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, When, Value, CharField, Count
+
+# olcha.facets dan nusxa: keyinchalik u o'zgarsa ham migratsiya o'zgarmaydi
+PRICE_BANDS = [100, 500, 1000, 5000, 10000, 50000, 100000]
+BAND_LABELS = ['0-100', '100-500', '500-1000', '1000-5000', '5000-10000', '10000-50000', '50000-100000', '100000+']
+
+
+def count_rows(products, attributes):
+    products = products.order_by()
+    band = Case(
+        *[When(price__lt=bound, then=Value(label)) for bound, label in zip(PRICE_BANDS, BAND_LABELS)],
+        default=Value(BAND_LABELS[-1]),
+        output_field=CharField(),
+    )
+    rows = [
+        ('brand', str(brand_id), count)
+        for brand_id, count in products.filter(brand__isnull=False).values_list('brand_id').annotate(count=Count('pk'))
+    ]
+    rows += [
+        ('price', label, count)
+        for label, count in products.annotate(band=band).values_list('band').annotate(count=Count('pk'))
+    ]
+    rows += [
+        ('attribute', f'{key_id}:{value_id}', count)
+        for key_id, value_id, count in attributes.order_by().filter(product__in=products.values('pk'))
+        .values_list('key_id', 'value_id').annotate(count=Count('product_id', distinct=True))
+    ]
+    return rows
+
+
+def fill_facet_counts(apps, schema_editor):
+    Category = apps.get_model('olcha', 'Category')
+    Product = apps.get_model('olcha', 'Product')
+    ProductAttribute = apps.get_model('olcha', 'ProductAttribute')
+    FacetCount = apps.get_model('olcha', 'FacetCount')
+    for category_id in Category.objects.values_list('pk', flat=True):
+        rows = count_rows(Product.objects.filter(category_id=category_id), ProductAttribute.objects.all())
+        FacetCount.objects.bulk_create([
+            FacetCount(category_id=category_id, facet=facet, value=value, count=count)
+            for facet, value, count in rows
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('brand', 'Brand'), ('price', 'Price'), ('attribute', 'Attribute')], max_length=20)),
+                ('value', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='olcha.category')),
+            ],
+            options={
+                'unique_together': {('category', 'facet', 'value')},
+            },
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0010_facetcount'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productattribute',
+            index=models.Index(fields=['key', 'value', 'product'], name='attribute_key_value_product'),
+        ),
+    ]
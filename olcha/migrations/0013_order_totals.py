@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def fill_order_totals(apps, schema_editor):
+    OrderItem = apps.get_model('olcha', 'OrderItem')
+    Order = apps.get_model('olcha', 'Order')
+    rows = OrderItem.objects.order_by().values_list('order_id') \
+        .annotate(total=Sum(F('price_when_ordered') * F('quantity')), count=Sum('quantity'))
+    for order_id, total, count in rows:
+        Order.objects.filter(pk=order_id).update(total=round(total, 2), item_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0012_order_idempotency_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_at'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:59
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('olcha', '0013_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='final_price',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.functions.math.Round(models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('price'), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('discount'))), '/', models.Value(Decimal('100.0'))), output_field=models.DecimalField(decimal_places=2, max_digits=14)), precision=2), output_field=models.DecimalField(decimal_places=2, max_digits=14)),
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction, connections
+from django.db.models import F, Case, When, Sum, ExpressionWrapper, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Round, Coalesce
 from decimal import Decimal
 from django.db.models import ForeignKey, Choices
+from django.utils import timezone
 from django.utils.text import slugify
 from users.models import CustomUser
 from django.core.exceptions import ValidationError
@@ -8,6 +11,21 @@ from django.core.exceptions import ValidationError
 
 # Create your models here.
 
+
+def money(expression):
+    return ExpressionWrapper(expression, output_field=models.DecimalField(max_digits=14, decimal_places=2))
+
+
+def final_price_expression(prefix=''):
+    """
+    Price after discount, the expression behind the Product.final_price column.
+    The database's ROUND rounds halves away from zero (10.05 at 50% off is
+    5.03), not to even like the Decimal.quantize of the old Python property.
+    """
+    # 100.0 ga bo'linadi, aks holda sqlite butun songa bo'lib yuboradi
+    price = money(F(f'{prefix}price') * (100 - F(f'{prefix}discount')) / Value(Decimal('100.0')))
+    return Round(price, precision=2)
+
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -65,11 +83,42 @@ class Product(BaseModel):
     discount = models.IntegerField(default=0)
     category = ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     brand = ForeignKey(Brand, related_name='products', on_delete=models.CASCADE, null=True, blank=True)
+    #baza o'zi hisoblaydi, narx yoki chegirma o'zgarsa yangilanadi
+    final_price = models.GeneratedField(
+        expression=final_price_expression(),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        db_persist=True,
+        db_index=True,
+    )
+
+    #commentlardan yig'iladi, Comment signallari yangilab turadi
+    avg_rating = models.FloatField(null=True, blank=True, db_index=True, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    @staticmethod
+    def rating_average():
+        """avg_rating computed from the stored histogram, rounded like before."""
+        total = sum(F(f'rating_{stars}') * stars for stars in range(1, 6))
+        return Case(
+            When(rating_count=0, then=None),
+            default=Round(Cast(total, models.FloatField()) / F('rating_count'), precision=2),
+            output_field=models.FloatField(),
+        )
+
+    @classmethod
+    def apply_rating(cls, product_id, rating, delta):
+        """Add (delta=1) or remove (delta=-1) a single rating of a product."""
+        bucket = f'rating_{rating}'
+        with transaction.atomic():
+            products = cls.objects.filter(pk=product_id)
+            products.update(**{bucket: F(bucket) + delta}, rating_count=F('rating_count') + delta)
+            products.update(avg_rating=cls.rating_average())
 
-    @property
-    def final_price(self):
-        price = self.price * Decimal(f'{1-(self.discount / 100)}')
-        return price.quantize(Decimal('1.00'))
 
 
 
@@ -98,6 +147,10 @@ class ProductAttribute(BaseModel):
     def __str__(self):
         return f"{self.product.title} - {self.key.key}: {self.value.value}"
 
+    class Meta:
+        #(key, value) -> product bo'yicha filterlash uchun
+        indexes = [models.Index(fields=['key', 'value', 'product'], name='attribute_key_value_product')]
+
 class Favorite(BaseModel):
     user = models.ForeignKey(CustomUser, related_name='favorites', on_delete=models.CASCADE, null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -109,13 +162,24 @@ class Favorite(BaseModel):
         unique_together = ('user', 'product')
 
 
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        return self.annotate(total_price=money(Sum(CartItem.line_total('items__'))))
+
+
 class Cart(BaseModel):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
     guest_session_key = models.CharField(max_length=40, null=True, blank=True, unique=True)
 
+    objects = CartQuerySet.as_manager()
+
     @property
     def total_cart_price(self):
-        return sum(item.total_item_price for item in self.items.all())
+        if hasattr(self, 'total_price'):
+            total = self.total_price
+        else:
+            total = self.items.aggregate(total=money(Sum(CartItem.line_total())))['total']
+        return total or Decimal('0.00')
 
     def clean(self):
         if self.user and self.guest_session_key:
@@ -127,16 +191,75 @@ class Cart(BaseModel):
         self.full_clean()
         super().save(*args, **kwargs)
 
+class CartItemQuerySet(models.QuerySet):
+    def add(self, cart_id, quantities, replace=False):
+        """
+        Add {product_id: quantity} to a cart in a single INSERT ... ON CONFLICT
+        statement: missing products are inserted, the quantity of products
+        already in the cart is increased by the database (or replaced with
+        `replace=True`), so concurrent adds are never lost. Ids of products
+        that do not exist are skipped by the same statement.
+
+        Returns {product_id: (item id, quantity)} of the affected items.
+        """
+        if not quantities:
+            return {}
+        connection = connections[self.db]
+        if not (connection.features.supports_update_conflicts_with_target
+                and connection.features.can_return_columns_from_insert):
+            return self._add_each(cart_id, quantities, replace)
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        products = connection.ops.quote_name(Product._meta.db_table)
+        cases = ' '.join(['WHEN %s THEN %s'] * len(quantities))
+        placeholders = ', '.join(['%s'] * len(quantities))
+        quantity = 'excluded.quantity' if replace else f'{table}.quantity + excluded.quantity'
+        sql = f'''
+            INSERT INTO {table} (cart_id, product_id, quantity, created_at, updated_at)
+            SELECT %s, id, CASE id {cases} END, %s, %s FROM {products} WHERE id IN ({placeholders})
+            ON CONFLICT (cart_id, product_id)
+            DO UPDATE SET quantity = {quantity}, updated_at = excluded.updated_at
+            RETURNING product_id, id, quantity
+        '''
+        params = [cart_id, *[value for pair in quantities.items() for value in pair], now, now, *quantities]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {product_id: (pk, quantity) for product_id, pk, quantity in cursor.fetchall()}
+
+    def _add_each(self, cart_id, quantities, replace):
+        result = {}
+        with transaction.atomic(using=self.db):
+            existing = set(Product.objects.using(self.db).filter(pk__in=quantities).values_list('pk', flat=True))
+            for product_id in existing:
+                item, created = self.get_or_create(cart_id=cart_id, product_id=product_id,
+                                                   defaults={'quantity': quantities[product_id]})
+                if not created:
+                    quantity = quantities[product_id] if replace else F('quantity') + quantities[product_id]
+                    self.filter(pk=item.pk).update(quantity=quantity)
+                    item.refresh_from_db(fields=['quantity'])
+                result[product_id] = (item.pk, item.quantity)
+        return result
+
+
 class CartItem(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     quantity = models.IntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.product} | {self.quantity}'
 
+    @staticmethod
+    def line_total(prefix=''):
+        return F(f'{prefix}product__final_price') * F(f'{prefix}quantity')
+
     @property
     def total_item_price(self):
+        if hasattr(self, 'total_price'):
+            return self.total_price
         return self.product.final_price * self.quantity
 
     class Meta:
@@ -144,6 +267,11 @@ class CartItem(BaseModel):
 
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        return self.annotate(total_price=money(Sum(F('items__price_when_ordered') * F('items__quantity'))))
+
+
 class Order(BaseModel):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 
@@ -154,10 +282,39 @@ class Order(BaseModel):
     )
 
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS)
+    #checkout qayta yuborilsa yangi order yaratilmaydi
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    #itemlardan yig'iladi: checkout va OrderItem signallari yangilab turadi
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_order_idempotency_key'),
+        ]
+        indexes = [models.Index(fields=['user', 'created_at'], name='order_user_created_at')]
+
+    @classmethod
+    def update_totals(cls, order_id):
+        """Recompute the stored total and item count of an order from its items."""
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        total = items.annotate(total=money(Sum(F('price_when_ordered') * F('quantity')))).values('total')
+        count = items.annotate(count=Sum('quantity')).values('count')
+        cls.objects.filter(pk=order_id).update(
+            total=Coalesce(Subquery(total), Decimal('0.00')),
+            item_count=Coalesce(Subquery(count), 0),
+        )
 
     @property
     def total_order_price(self):
-        return sum(item.price_when_ordered * item.quantity for item in self.items.all())
+        if hasattr(self, 'total_price'):
+            total = self.total_price
+        else:
+            total = self.items.aggregate(total=money(Sum(F('price_when_ordered') * F('quantity'))))['total']
+        return total or Decimal('0.00')
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -181,3 +338,21 @@ class Comment(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='comments')
 
 
+class FacetCount(models.Model):
+    """
+    Precomputed number of products of a category per facet value, kept up to
+    date by signals (see olcha/facets.py).
+    """
+    FACETS = (
+        ('brand', 'Brand'),
+        ('price', 'Price'),
+        ('attribute', 'Attribute'),
+    )
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facet_counts')
+    facet = models.CharField(max_length=20, choices=FACETS)
+    value = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('category', 'facet', 'value'),)
@@ -1,7 +1,141 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class MyPagination(LimitOffsetPagination):
     default_limit = 100
     max_limit = 100
     limit_query_param = 'limit'
-    offset_query_param = 'offset'
\ No newline at end of file
+    offset_query_param = 'offset'
+
+
+class KeysetPagination(MyPagination):
+    """
+    Limit/offset pagination that switches to keyset pagination when the
+    request has a `cursor` param (empty for the first page).
+
+    Keyset pages continue after the last row of the previous page with a
+    WHERE on the ordering fields plus pk, so deep pages cost the same as the
+    first one, and no COUNT query is run.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset)
+
+        queryset = queryset.order_by(*[self.order_expression(*field) for field in self.ordering])
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        page = list(queryset[:self.limit + 1])
+        self.next_position = None
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            self.next_position = self.get_position(page[-1], queryset.model)
+        return page
+
+    def get_position(self, row, model):
+        if isinstance(row, dict):
+            # values() qatorlarida pk o'z nomi bilan keladi
+            return [row[model._meta.pk.attname if name == 'pk' else name] for name, descending, nullable in self.ordering]
+        return [getattr(row, name) for name, descending, nullable in self.ordering]
+
+    def get_ordering(self, queryset):
+        """(name, descending, nullable) for every ordering field, ending with pk."""
+        ordering = [field for field in queryset.query.order_by or queryset.model._meta.ordering
+                    if isinstance(field, str)]
+        result = []
+        for field in ordering:
+            name = field.lstrip('-')
+            if name in ('pk', queryset.model._meta.pk.name):
+                name = 'pk'
+            try:
+                nullable = name != 'pk' and queryset.model._meta.get_field(name).null
+            except FieldDoesNotExist:
+                nullable = False
+            result.append((name, field.startswith('-'), nullable))
+            if name == 'pk':
+                return result
+        return result + [('pk', bool(result) and result[0][1], False)]
+
+    def order_expression(self, name, descending, nullable):
+        if not nullable:
+            return f'-{name}' if descending else name
+        # null qiymatlar hamma bazada oxirida turishi kerak
+        return F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True)
+
+    def after(self, position):
+        condition = None
+        equal = Q()
+        for (name, descending, nullable), value in zip(self.ordering, position):
+            if value is not None:
+                beyond = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+                if nullable:
+                    beyond |= Q(**{f'{name}__isnull': True})
+                beyond &= equal
+                condition = beyond if condition is None else condition | beyond
+            equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+        return condition if condition is not None else Q(pk__in=[])
+
+    def get_field(self, queryset, name):
+        """Model field or annotation output field that converts cursor values of `name`."""
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        field = queryset.model._meta.get_field(name)
+        # GeneratedField qiymatlarini o'z output_field i o'giradi
+        return getattr(field, 'output_field', field)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [None if value is None else self.get_field(queryset, name).to_python(value)
+                    for (name, descending, nullable), value in zip(self.ordering, position)]
+        except (ValidationError, TypeError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        # datetime to'liq (mikrosekundlari bilan) saqlanadi, aks holda teng qiymatlar yo'qoladi
+        encoded = json.dumps(position, default=lambda value: value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return base64.urlsafe_b64encode(encoded.encode()).decode()
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
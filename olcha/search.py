@@ -0,0 +1,160 @@
+"""
+Full-text product search.
+
+Products are indexed together with their brand and category titles in a
+separate table maintained by signals. The backend is chosen from the
+database vendor: SQLite uses an FTS5 virtual table, PostgreSQL a tsvector
+column with a GIN index. Other databases have no backend and keep using
+the plain `icontains` search of DRF's SearchFilter.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+TABLE = 'olcha_product_search'
+
+# product, its brand and category titles in one row
+DOCUMENTS_SQL = '''
+    SELECT p.id, p.title, COALESCE(p.description, ''), COALESCE(b.title, ''), c.title
+    FROM olcha_product p
+    JOIN olcha_category c ON c.id = p.category_id
+    LEFT JOIN olcha_brand b ON b.id = p.brand_id
+'''
+
+SCOPES = {
+    'products': 'p.id IN ({})',
+    'brand': 'p.brand_id = %s',
+    'category': 'p.category_id = %s',
+}
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+class SearchBackend:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create(self):
+        raise NotImplementedError
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+    def match_query(self, terms):
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """
+        Products of `queryset` matching `query`, annotated with `search_rank`
+        (lower is better). There is no limit, so other filters and orderings
+        of the queryset are applied by the database to every match.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        match = self.match_query(terms)
+        product = f'{self.connection.ops.quote_name(queryset.model._meta.db_table)}.id'
+        return queryset.filter(pk__in=RawSQL(self.match_sql, [match])).annotate(
+            search_rank=RawSQL(self.rank_sql.format(product=product), [match], output_field=FloatField()))
+
+    def _where(self, scope, values):
+        if scope is None:
+            return '', []
+        if scope == 'products':
+            return 'WHERE ' + SCOPES[scope].format(', '.join(['%s'] * len(values))), list(values)
+        return 'WHERE ' + SCOPES[scope], [values]
+
+    def delete(self, scope=None, values=None):
+        where, params = self._where(scope, values)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE {self.id_column} IN (SELECT p.id FROM olcha_product p {where})', params)
+
+    def remove_products(self, pks):
+        if pks:
+            with self.connection.cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(pks))
+                cursor.execute(f'DELETE FROM {TABLE} WHERE {self.id_column} IN ({placeholders})', list(pks))
+
+    def reindex(self, scope=None, values=None):
+        """
+        Rebuild the rows of every product (scope=None), of the given product
+        ids ('products'), or of one brand or category ('brand'/'category').
+        """
+        if scope == 'products' and not values:
+            return
+        where, params = self._where(scope, values)
+        if scope is None:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {TABLE}')
+        else:
+            self.delete(scope, values)
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.insert_sql.format(documents=f'{DOCUMENTS_SQL} {where}'), params)
+
+
+class SqliteSearchBackend(SearchBackend):
+    id_column = 'rowid'
+    insert_sql = f'INSERT INTO {TABLE} (rowid, title, description, brand, category) {{documents}}'
+    match_sql = f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s'
+    # bm25 manfiy, eng mosi eng kichigi. LIMIT -1 ichki so'rovni yoyib
+    # yuborishga qo'ymaydi: sqlite uni bir marta hisoblab indekslaydi, har
+    # qator uchun qaytadan MATCH qilmaydi
+    rank_sql = (f'SELECT ranked.rank FROM (SELECT rowid AS id, bm25({TABLE}, 10.0, 1.0, 4.0, 4.0) AS rank '
+                f'FROM {TABLE} WHERE {TABLE} MATCH %s LIMIT -1) AS ranked WHERE ranked.id = {{product}}')
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+                "title, description, brand, category, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def match_query(self, terms):
+        # har bir so'z prefiks sifatida qidiriladi, "iph" -> "iphone"
+        return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+class PostgresSearchBackend(SearchBackend):
+    id_column = 'product_id'
+    insert_sql = f'''
+        INSERT INTO {TABLE} (product_id, document)
+        SELECT id,
+               setweight(to_tsvector('simple', title), 'A') ||
+               setweight(to_tsvector('simple', brand), 'B') ||
+               setweight(to_tsvector('simple', category), 'B') ||
+               setweight(to_tsvector('simple', description), 'C')
+        FROM ({{documents}}) AS documents (id, title, description, brand, category)
+    '''
+    match_sql = f"SELECT product_id FROM {TABLE} WHERE document @@ to_tsquery('simple', %s)"
+    rank_sql = (f"SELECT -ts_rank(document, to_tsquery('simple', %s)) FROM {TABLE} "
+                f'WHERE product_id = {{product}}')
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} (product_id bigint PRIMARY KEY, document tsvector NOT NULL)')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING GIN (document)')
+
+    def match_query(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+BACKENDS = {
+    'sqlite': 'olcha.search.SqliteSearchBackend',
+    'postgresql': 'olcha.search.PostgresSearchBackend',
+}
+
+
+def get_backend(using=None):
+    """
+    Search backend for `using` (the default connection), or None if its
+    vendor has none. PRODUCT_SEARCH_BACKENDS in settings can add or replace
+    backends per vendor.
+    """
+    using = using or connection
+    path = {**BACKENDS, **getattr(settings, 'PRODUCT_SEARCH_BACKENDS', {})}.get(using.vendor)
+    return import_string(path)(using) if path else None
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from olcha.models import (CategoryGroup, Category, Product,
                           ProductAttribute, CartItem, Cart,
-                          Brand, Comment, Favorite)
+                          Brand, Comment, Favorite, Order, OrderItem)
 
 
 class CategoryGroupSerializer(serializers.ModelSerializer):
@@ -22,18 +22,77 @@ class ProductAttributeSerializer(serializers.ModelSerializer):
         fields = ['key', 'value']
 
 class ProductSerializer(serializers.ModelSerializer):
-    final_price = serializers.SerializerMethodField()
+    # oldingidek JSON da son bo'lib chiqadi
+    final_price = serializers.DecimalField(max_digits=14, decimal_places=2, coerce_to_string=False, read_only=True)
     attributes = ProductAttributeSerializer(many=True, read_only=True)
-    avg_rating = serializers.FloatField(read_only=True)
-
-    def get_final_price(self, obj):
-        return obj.final_price
 
     class Meta:
         model = Product
         fields = '__all__'
 
 
+class FastSerializer:
+    """
+    Read-only counterpart of a ModelSerializer that works on `values()` rows.
+
+    A converter per field is compiled once from the serializer's own fields,
+    so a row is turned into the same output with one dict comprehension
+    instead of DRF's per-field dispatch. Fields that are not plain columns
+    (method fields, nested serializers) are filled by `compute_<name>(rows)`.
+    """
+    serializer_class = None
+    # bazadan kelgan qiymat o'zi tayyor natija
+    plain_fields = (serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+                    serializers.FloatField, serializers.PrimaryKeyRelatedField)
+
+    def __init__(self):
+        opts = self.serializer_class.Meta.model._meta
+        self.names, self.columns, converters = [], [], []
+        for name, field in self.serializer_class().fields.items():
+            self.names.append(name)
+            if hasattr(self, f'compute_{name}'):
+                converters.append(None)
+                continue
+            column = opts.get_field(field.source).attname
+            self.columns.append(column)
+            converters.append((column, None if isinstance(field, self.plain_fields) else field.to_representation))
+        self.converters = converters
+        self.computed = [name for name, converter in zip(self.names, converters) if converter is None]
+
+    def rows(self, queryset):
+        """`queryset` as rows with the columns this serializer needs."""
+        # annotatsiyalar (masalan search_rank) keyset pagination uchun kerak
+        return queryset.prefetch_related(None).values(*self.columns, *queryset.query.annotations)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        computed = {name: getattr(self, f'compute_{name}')(rows) for name in self.computed}
+        result = []
+        for index, row in enumerate(rows):
+            item = {}
+            for name, converter in zip(self.names, self.converters):
+                if converter is None:
+                    item[name] = computed[name][index]
+                    continue
+                column, convert = converter
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+            result.append(item)
+        return result
+
+
+class ProductFastSerializer(FastSerializer):
+    serializer_class = ProductSerializer
+
+    def compute_attributes(self, rows):
+        attributes = {row['id']: [] for row in rows}
+        pairs = ProductAttribute.objects.filter(product_id__in=list(attributes)) \
+            .order_by('pk').values_list('product_id', 'key__key', 'value__value')
+        for product_id, key, value in pairs:
+            attributes[product_id].append({'key': key, 'value': value})
+        return [attributes[row['id']] for row in rows]
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     total_item_price = serializers.SerializerMethodField()
 
@@ -45,7 +104,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class CartSerializer(serializers.ModelSerializer):
-    cart_items = CartItemSerializer(many=True, read_only=True)
+    cart_items = CartItemSerializer(many=True, read_only=True, source='items')
     total_cart_price = serializers.SerializerMethodField()
 
     def get_total_cart_price(self, obj):
@@ -55,6 +114,23 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = '__all__'
 
+class OrderItemSerializer(serializers.ModelSerializer):
+    title = serializers.CharField(source='product.title', read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'title', 'quantity', 'price_when_ordered']
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+    total_order_price = serializers.DecimalField(source='total', max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'status', 'created_at', 'total_order_price', 'item_count', 'items']
+
+
 class BrandSerializer(serializers.ModelSerializer):
     class Meta:
         model = Brand
@@ -67,7 +143,28 @@ class CommentSerializer(serializers.ModelSerializer):
 
 class AddToCartSerializer(serializers.Serializer):
     pk = serializers.IntegerField()
-    quantity = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CartItemQuantitySerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add' and not attrs.get('quantity'):
+            raise serializers.ValidationError({'quantity': 'A positive quantity is required for add.'})
+        if attrs['op'] == 'set' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required for set.'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=500)
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
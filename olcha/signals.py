@@ -1,39 +1,208 @@
 from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Cart
-from django.core.cache import cache
-from django.db.models.signals import post_save, post_delete
-from .models import Product, Category
+from .models import Cart, CartItem
+from django.db.models.signals import post_save, post_delete, pre_save
+from .models import (Product, Category, CategoryGroup, Brand, ProductAttribute,
+                     AttributeKey, AttributeValue, Comment, Order, OrderItem)
+from olcha import caching, facets
+from olcha.search import get_backend
 
 #user login qiganida cartlani qo'shib yuborish
 @receiver(user_logged_in)
 def merge_guest_cart(sender, user, request, **kwargs):
+    """
+    Move the guest cart of the session into the user's cart with a fixed
+    number of queries: one upsert adds the guest items, summing the
+    quantities of products that are in both carts, then the guest cart is
+    deleted.
+    """
     session_key = request.session.session_key
     if not session_key:
         return
 
-    guest_cart = Cart.objects.filter(guest_session_key=session_key).first()
-    if not guest_cart:
+    with transaction.atomic():
+        guest_cart = Cart.objects.filter(guest_session_key=session_key).first()
+        if not guest_cart:
+            return
+
+        user_cart, created = Cart.objects.get_or_create(user=user)
+        CartItem.objects.add(user_cart.pk, dict(guest_cart.items.values_list('product_id', 'quantity')))
+        guest_cart.delete()
+
+
+
+#reytinglar productda saqlanadi, cache yangilanishidan oldin hisoblanishi kerak
+@receiver(pre_save, sender=Comment)
+def remember_comment_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = Comment.objects.filter(pk=instance.pk) \
+            .values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Comment)
+def comment_rating_update(sender, instance, created=False, raw=False, **kwargs):
+    # fixtures are loaded raw, loaddata rebuilds every product's ratings afterwards
+    if raw:
+        return
+    previous = instance._previous_rating
+    if previous == (instance.product_id, instance.rating):
+        return
+    with transaction.atomic():
+        if previous:
+            Product.apply_rating(*previous, -1)
+        Product.apply_rating(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_rating_delete(sender, instance, **kwargs):
+    Product.apply_rating(instance.product_id, instance.rating, -1)
+
+
+#order jami summasi va itemlar soni orderda saqlanadi
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_totals_update(sender, instance=None, raw=False, **kwargs):
+    if raw:
         return
+    Order.update_totals(instance.order_id)
+
+
+def bump_product(product_id):
+    scope = Product.objects.filter(pk=product_id).values_list('category_id', 'brand_id').first()
+    caching.bump(*caching.product_namespaces(product_id, *(scope or ())))
 
-    user_cart, created = Cart.objects.get_or_create(user=user)
 
-    for item in guest_cart.items.all():
-        existing = user_cart.items.filter(product=item.product).first()
-        if existing:
-            existing.quantity += item.quantity
-            existing.save()
-        else:
-            item.cart = user_cart
-            item.save()
+#productni kategoriyasi yoki brendi o'zgarsa eskisini ham yangilash kerak
+@receiver(pre_save, sender=Product)
+def remember_product_scope(sender, instance, raw=False, **kwargs):
+    instance._previous_scope = None
+    if instance.pk and not raw:
+        instance._previous_scope = Product.objects.filter(pk=instance.pk) \
+            .values_list('category_id', 'brand_id', 'price').first()
+
+
+#facet sonlari ham cache yangilanishidan oldin o'zgarishi kerak
+@receiver(post_save, sender=Product)
+def product_facets_update(sender, instance=None, created=False, raw=False, **kwargs):
+    # fixtures are loaded raw, loaddata rebuilds the facet counts afterwards
+    if raw:
+        return
+    current = facets.product_facets(instance.brand_id, instance.price)
+    previous = instance._previous_scope
+    with transaction.atomic():
+        if previous:
+            category_id, brand_id, price = previous
+            old = facets.product_facets(brand_id, price)
+            if category_id == instance.category_id and old == current:
+                return
+            facets.apply(category_id, old, -1)
+            if category_id != instance.category_id:
+                attributes = facets.attribute_facets(instance.pk)
+                facets.apply(category_id, attributes, -1)
+                facets.apply(instance.category_id, attributes, 1)
+        facets.apply(instance.category_id, current, 1)
 
-    guest_cart.delete()
+
+@receiver(post_delete, sender=Product)
+def product_facets_delete(sender, instance=None, **kwargs):
+    facets.apply(instance.category_id, facets.product_facets(instance.brand_id, instance.price), -1)
+
+
+@receiver(pre_save, sender=ProductAttribute)
+def remember_attribute(sender, instance, raw=False, **kwargs):
+    instance._previous_attribute = None
+    if instance.pk and not raw:
+        instance._previous_attribute = ProductAttribute.objects.filter(pk=instance.pk) \
+            .values_list('product__category_id', 'key_id', 'value_id').first()
+
+
+@receiver(post_save, sender=ProductAttribute)
+def attribute_facets_update(sender, instance=None, raw=False, **kwargs):
+    if raw:
+        return
+    category_id = Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True).first()
+    current = ('attribute', facets.attribute_value(instance.key_id, instance.value_id))
+    previous = instance._previous_attribute
+    if previous == (category_id, instance.key_id, instance.value_id):
+        return
+    with transaction.atomic():
+        if previous:
+            facets.apply(previous[0], [('attribute', facets.attribute_value(*previous[1:]))], -1)
+        facets.apply(category_id, [current], 1)
+
+
+@receiver(post_delete, sender=ProductAttribute)
+def attribute_facets_delete(sender, instance=None, **kwargs):
+    category_id = Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True).first()
+    if category_id is not None:
+        facets.apply(category_id, [('attribute', facets.attribute_value(instance.key_id, instance.value_id))], -1)
 
 
 @receiver([post_delete, post_save], sender=Product)
 def product_list_cache_update(sender, instance=None, created=False, **kwargs):
-    cache.clear()
+    namespaces = caching.product_namespaces(instance.pk, instance.category_id, instance.brand_id)
+    previous = getattr(instance, '_previous_scope', None)
+    if previous:
+        namespaces += caching.product_namespaces(instance.pk, *previous[:2])
+    caching.bump(*namespaces)
+
 
 @receiver([post_delete, post_save], sender=Category)
 def category_list_cache_update(sender, instance=None, created=False, **kwargs):
-    cache.clear()
+    caching.bump(caching.CATEGORIES)
+
+
+@receiver([post_delete, post_save], sender=CategoryGroup)
+def category_group_list_cache_update(sender, instance=None, created=False, **kwargs):
+    caching.bump(caching.CATEGORY_GROUPS)
+
+
+@receiver([post_delete, post_save], sender=Brand)
+def brand_list_cache_update(sender, instance=None, created=False, **kwargs):
+    # brend sahifasi shu namespace ga bog'langan
+    caching.bump(caching.BRANDS, caching.brand_products_namespace(instance.pk))
+
+
+@receiver([post_delete, post_save], sender=AttributeKey)
+@receiver([post_delete, post_save], sender=AttributeValue)
+def attribute_cache_update(sender, instance=None, created=False, **kwargs):
+    caching.bump(caching.CATALOG)
+
+
+@receiver([post_delete, post_save], sender=ProductAttribute)
+@receiver([post_delete, post_save], sender=Comment)
+def product_related_cache_update(sender, instance=None, created=False, **kwargs):
+    bump_product(instance.product_id)
+
+
+#qidiruv indeksi product, brend va kategoriya nomlaridan tuziladi
+@receiver(post_save, sender=Product)
+def product_search_index_update(sender, instance=None, raw=False, **kwargs):
+    # fixtures are loaded raw, loaddata rebuilds the whole index afterwards
+    backend = get_backend()
+    if backend and not raw:
+        backend.reindex('products', [instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_search_index_delete(sender, instance=None, **kwargs):
+    backend = get_backend()
+    if backend:
+        backend.remove_products([instance.pk])
+
+
+@receiver(pre_save, sender=Brand)
+@receiver(pre_save, sender=Category)
+def remember_title(sender, instance, raw=False, **kwargs):
+    instance._previous_title = None
+    if instance.pk and not raw:
+        instance._previous_title = sender.objects.filter(pk=instance.pk).values_list('title', flat=True).first()
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def title_search_index_update(sender, instance=None, created=False, raw=False, **kwargs):
+    backend = get_backend()
+    if backend and not created and not raw and instance._previous_title != instance.title:
+        backend.reindex('brand' if sender is Brand else 'category', instance.pk)
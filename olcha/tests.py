@@ -1,3 +1,1106 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.backends.db import SessionStore
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection, OperationalError
+from django.db.models import F
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from olcha import caching, facets
+from olcha.benchmark import percentile, measure
+from olcha.renderers import FastJSONRenderer
+from olcha.serializers import ProductSerializer, ProductFastSerializer
+from olcha.models import (CategoryGroup, Category, Brand, Product, Comment,
+                          AttributeKey, AttributeValue, ProductAttribute, Order, OrderItem, Cart, CartItem)
+from root.cache_backends import SQLiteCache, TieredCache
+from users.models import CustomUser
+from root.urls import urlpatterns as root_urlpatterns
+
+# test runner DEBUG=False bilan ishlaydi, shuning uchun root.urls toolbar manzillarisiz yuklanadi
+urlpatterns = root_urlpatterns + [path('__debug__/', include('debug_toolbar.urls'))]
+
+_test_cache_directories = {}
+
+
+def test_caches():
+    """CACHES with the shared tier in a temporary file of this process (parallel test workers get their own)."""
+    directory = _test_cache_directories.get(os.getpid())
+    if directory is None:
+        directory = _test_cache_directories[os.getpid()] = tempfile.TemporaryDirectory(prefix='olcha_test_cache_')
+    shared = {**settings.CACHES['shared'], 'LOCATION': os.path.join(directory.name, 'cache.sqlite3')}
+    return {**settings.CACHES, 'shared': shared}
+
+
+class IsolatedCacheMixin:
+    """Tests never touch (or clear) the cache of the dev server."""
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(CACHES=test_caches()))
+        super().setUpClass()
+
+
+def load_fixture(objects):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'fixture.json')
+        with open(path, 'w') as file:
+            json.dump(objects, file)
+        call_command('loaddata', path, verbosity=0)
+
+
+class CatalogTestCase(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = CategoryGroup.objects.create(title='Electronics', image='category_groups/e.png')
+        cls.category = Category.objects.create(title='Phones', image='category/p.png', groups=cls.group)
+        cls.other_category = Category.objects.create(title='Laptops', image='category/l.png', groups=cls.group)
+        cls.brand = Brand.objects.create(title='Apple', logo='brands/a.png')
+        cls.product = Product.objects.create(title='iPhone', price='1000.00', discount=10,
+                                             category=cls.category, brand=cls.brand)
+        cls.user = CustomUser.objects.create_user(username='ali', phone_number='+998901234567', password='pass')
+
+    def setUp(self):
+        cache.clear()
+
+
+class CacheInvalidationTests(CatalogTestCase):
+    def test_product_list_is_served_from_cache(self):
+        url = reverse('olcha:products-list')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_product_save_invalidates_product_list(self):
+        url = reverse('olcha:products-list')
+        self.client.get(url)
+        Product.objects.filter(pk=self.product.pk).update(title='stale')
+        self.assertEqual(self.client.get(url).json()['results'][0]['title'], 'iPhone')
+
+        self.product.title = 'iPhone 15'
+        self.product.save()
+        self.assertEqual(self.client.get(url).json()['results'][0]['title'], 'iPhone 15')
+
+    def test_comment_invalidates_product_detail(self):
+        url = reverse('olcha:products-detail', args=[self.product.pk])
+        self.assertIsNone(self.client.get(url).json()['avg_rating'])
+        Comment.objects.create(text='good', rating=5, user=self.user, product=self.product)
+        self.assertEqual(self.client.get(url).json()['avg_rating'], 5.0)
+
+    def test_brand_change_keeps_category_cache(self):
+        categories = reverse('olcha:categories-list')
+        self.client.get(categories)
+        self.brand.title = 'Apple Inc'
+        self.brand.save()
+        with self.assertNumQueries(0):
+            self.client.get(categories)
+
+    def test_filtered_list_is_cached_regardless_of_param_order(self):
+        url = reverse('olcha:products-list')
+        self.client.get(url, {'category': self.category.pk, 'ordering': '-price'})
+        with self.assertNumQueries(0):
+            self.client.get(f'{url}?ordering=-price&category={self.category.pk}')
+
+    def test_product_save_invalidates_only_its_category(self):
+        url = reverse('olcha:products-list')
+        self.client.get(url, {'category': self.category.pk})
+        self.client.get(url, {'category': self.other_category.pk})
+
+        self.product.category = self.other_category
+        self.product.save()
+
+        self.assertEqual(self.client.get(url, {'category': self.category.pk}).json()['count'], 0)
+        self.assertEqual(self.client.get(url, {'category': self.other_category.pk}).json()['count'], 1)
+
+    def test_padded_ids_share_the_namespace_signals_bump(self):
+        url = reverse('olcha:products-list')
+        detail = f'{url}0{self.product.pk}/'
+        self.client.get(url, {'category': f'0{self.category.pk}'})
+        self.client.get(detail)
+
+        self.product.title = 'iPhone 15'
+        self.product.save()
+
+        self.assertEqual(self.client.get(url, {'category': f'0{self.category.pk}'}).json()['results'][0]['title'],
+                         'iPhone 15')
+        self.assertEqual(self.client.get(detail).json()['title'], 'iPhone 15')
+
+    def test_invalid_ids_are_rejected_before_any_namespace(self):
+        url = reverse('olcha:products-list')
+        with mock.patch.object(caching, 'get_generations') as get_generations:
+            self.assertEqual(self.client.get(url, {'category': 'junk'}).status_code, 400)
+            self.assertEqual(self.client.get(url, {'brand': '1x'}).status_code, 400)
+            self.assertEqual(self.client.get(reverse('olcha:products-facets'), {'brand': 'x'}).status_code, 400)
+            self.assertEqual(self.client.get(f'{url}junk/').status_code, 404)
+        get_generations.assert_not_called()
+
+    def test_generation_keys_expire(self):
+        with mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            caching.get_generations(['products:brand:404'])
+            caching.bump('products:brand:404')
+        for call in set_many.call_args_list:
+            self.assertEqual(call.kwargs['timeout'], caching.GENERATION_TIMEOUT)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def test_matching_etag_returns_not_modified_without_queries(self):
+        url = reverse('olcha:products-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_product_changes(self):
+        url = reverse('olcha:products-detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        self.product.discount = 20
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_brand_list_honours_if_modified_since(self):
+        url = reverse('olcha:brands-list')
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class DebugToolbarTests(CatalogTestCase):
+    @override_settings(DEBUG=True, ROOT_URLCONF='olcha.tests')
+    def test_cached_endpoints_work_with_the_toolbar(self):
+        for name in ['olcha:products-list', 'olcha:categories-list', 'olcha:category-groups-list', 'olcha:brands-list']:
+            for _ in range(2):
+                response = self.client.get(reverse(name), {'search': 'iphone'} if name == 'olcha:products-list' else {},
+                                           HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response.status_code, 200, name)
+
+
+class RenderedCacheTests(CatalogTestCase):
+    def test_hit_is_served_without_rendering(self):
+        url = reverse('olcha:products-list')
+        plain = self.client.get(url)
+        with mock.patch.object(FastJSONRenderer, 'render') as render, self.assertNumQueries(0):
+            again = self.client.get(url)
+        render.assert_not_called()
+        self.assertEqual(again.content, plain.content)
+        self.assertEqual(again['Content-Type'], 'application/json')
+
+    def test_gzip(self):
+        url = reverse('olcha:categories-list')
+        plain = self.client.get(url)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+    @override_settings(CACHE_RESPONSE_GZIP=False)
+    def test_gzip_can_be_disabled(self):
+        response = self.client.get(reverse('olcha:products-list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_browsable_api_is_rendered_per_request(self):
+        response = self.client.get(reverse('olcha:products-list'), {'format': 'api'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'iPhone', response.content)
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {'price': Decimal('9.90'), 'title': 'Olma \u2013 ğ', 'when': timezone.now(), 'items': [1, None, 2.5]}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+
+class QueryCountTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        keys = [AttributeKey.objects.create(key=f'key {i}') for i in range(3)]
+        values = [AttributeValue.objects.create(value=f'value {i}') for i in range(3)]
+        for i in range(10):
+            product = Product.objects.create(title=f'Phone {i}', price='100.00', category=cls.category, brand=cls.brand)
+            for key, value in zip(keys, values):
+                ProductAttribute.objects.create(product=product, key=key, value=value)
+
+    def count_queries(self, url, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, params)
+        return len(queries)
+
+    def test_product_list_query_count_does_not_grow_with_page_size(self):
+        url = reverse('olcha:products-list')
+        self.assertEqual(self.count_queries(url, limit=2), self.count_queries(url, limit=11))
+
+    def test_brand_page_query_count_does_not_grow_with_products(self):
+        url = reverse('olcha:brands-detail', args=[self.brand.slug])
+        before = self.count_queries(url)
+        Product.objects.filter(title__startswith='Phone').delete()
+        self.assertEqual(self.count_queries(url), before)
+
+
+class BrandPageTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(12):
+            Product.objects.create(title=f'Phone {i:02}', price='100.00', category=cls.category, brand=cls.brand)
+        Product.objects.create(title='MacBook', price='2000.00', category=cls.other_category, brand=cls.brand)
+        cls.other_brand = Brand.objects.create(title='Samsung', logo='brands/s.png')
+        cls.url = reverse('olcha:brands-detail', args=[cls.brand.slug])
+
+    def test_groups_are_counted_and_bounded(self):
+        data = self.client.get(self.url).json()['data']
+        self.assertEqual([(group['category'], group['count'], len(group['products'])) for group in data],
+                         [('Laptops', 1, 1), ('Phones', 13, 10)])
+        self.assertIsNone(data[0]['next'])
+        self.assertIn(f'category={self.category.pk}', data[1]['next'])
+
+    def test_group_pagination(self):
+        data = self.client.get(self.url, {'category': self.category.pk, 'limit': 10, 'offset': 10}).json()['data']
+        self.assertEqual(len(data), 1)
+        self.assertEqual([product['title'] for product in data[0]['products']], ['Phone 10', 'Phone 11', 'iPhone'])
+        self.assertIsNone(data[0]['next'])
+
+    def test_cache_is_invalidated_only_by_own_products(self):
+        self.client.get(self.url)
+        Product.objects.create(title='Galaxy', price='450.00', category=self.category, brand=self.other_brand)
+        with self.assertNumQueries(1):
+            # only the brand lookup
+            self.client.get(self.url)
+        Product.objects.create(title='iPad', price='500.00', category=self.other_category, brand=self.brand)
+        self.assertEqual(self.client.get(self.url).json()['data'][0]['count'], 2)
+
+
+class CartMutationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.url = reverse('olcha:cart-add-to-cart')
+
+    def test_add_increments_in_one_statement(self):
+        self.client.post(self.url, {'pk': self.product.pk, 'quantity': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'pk': self.product.pk, 'quantity': 3})
+        self.assertEqual(response.data['quantity'], 5)
+        self.assertEqual(len([query for query in queries.captured_queries if 'olcha_cartitem' in query['sql']]), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+    def test_add_validation(self):
+        self.assertEqual(self.client.post(self.url, {'pk': 0, 'quantity': 1}).status_code, 404)
+        self.assertEqual(self.client.post(self.url, {'pk': self.product.pk, 'quantity': 0}).status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_update_quantity(self):
+        item_id = self.client.post(self.url, {'pk': self.product.pk, 'quantity': 2}).data['id']
+        url = reverse('olcha:cart-update-product-quantity', args=[item_id])
+        self.assertEqual(self.client.patch(url, {'quantity': 'x'}, content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'quantity': 7}, content_type='application/json').status_code, 200)
+        self.assertEqual(CartItem.objects.get().quantity, 7)
+        other = reverse('olcha:cart-update-product-quantity', args=[item_id + 1])
+        self.assertEqual(self.client.patch(other, {'quantity': 7}, content_type='application/json').status_code, 404)
+
+
+    def batch(self, *operations):
+        return self.client.post(reverse('olcha:cart-batch'), {'operations': list(operations)},
+                                content_type='application/json')
+
+    def test_batch_operations(self):
+        products = [Product.objects.create(title=f'Case {i}', price='10.00', category=self.category) for i in range(3)]
+        self.client.post(self.url, {'pk': products[2].pk, 'quantity': 1})
+        response = self.batch(
+            {'op': 'add', 'product': self.product.pk, 'quantity': 2},
+            {'op': 'add', 'product': self.product.pk, 'quantity': 1},
+            {'op': 'remove', 'product': products[0].pk},
+            {'op': 'add', 'product': products[0].pk, 'quantity': 4},
+            {'op': 'set', 'product': products[1].pk, 'quantity': 6},
+            {'op': 'remove', 'product': products[2].pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['product']: item['quantity'] for item in response.data['cart_items']},
+                         {self.product.pk: 3, products[0].pk: 4, products[1].pk: 6})
+
+    def test_batch_is_atomic(self):
+        response = self.batch({'op': 'add', 'product': self.product.pk, 'quantity': 2},
+                              {'op': 'set', 'product': 0, 'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_batch_query_count_does_not_grow(self):
+        products = [Product.objects.create(title=f'Case {i}', price='10.00', category=self.category) for i in range(30)]
+
+        def sync(products):
+            with CaptureQueriesContext(connection) as queries:
+                self.batch(*[{'op': 'add', 'product': product.pk, 'quantity': 1} for product in products],
+                           *[{'op': 'set', 'product': product.pk, 'quantity': 2} for product in products[:2]])
+            return len(queries)
+
+        self.client.get(reverse('olcha:cart-list'))
+        self.assertEqual(sync(products[:3]), sync(products))
+
+
+class GuestCartMergeTests(CatalogTestCase):
+    def login(self, session_key):
+        request = RequestFactory().post('/')
+        request.session = SessionStore(session_key)
+        user_logged_in.send(sender=CustomUser, request=request, user=self.user)
+
+    def make_guest_cart(self, quantities):
+        session = SessionStore()
+        session.create()
+        cart = Cart.objects.create(guest_session_key=session.session_key)
+        CartItem.objects.add(cart.pk, quantities)
+        return session.session_key
+
+    def test_overlapping_carts_are_merged(self):
+        products = [Product.objects.create(title=f'Case {i}', price='10.00', category=self.category) for i in range(3)]
+        user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.add(user_cart.pk, {self.product.pk: 1, products[0].pk: 2})
+        session_key = self.make_guest_cart({self.product.pk: 3, products[1].pk: 4, products[2].pk: 5})
+
+        self.login(session_key)
+
+        self.assertEqual(dict(user_cart.items.values_list('product_id', 'quantity')),
+                         {self.product.pk: 4, products[0].pk: 2, products[1].pk: 4, products[2].pk: 5})
+        self.assertFalse(Cart.objects.filter(guest_session_key=session_key).exists())
+
+    def test_guest_cart_becomes_user_cart_items(self):
+        session_key = self.make_guest_cart({self.product.pk: 2})
+        self.login(session_key)
+        self.assertEqual(Cart.objects.get().user, self.user)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        products = [Product.objects.create(title=f'Case {i}', price='10.00', category=self.category) for i in range(20)]
+
+        def merge(products):
+            Cart.objects.all().delete()
+            CartItem.objects.add(Cart.objects.create(user=self.user).pk, {product.pk: 1 for product in products[::2]})
+            session_key = self.make_guest_cart({product.pk: 1 for product in products})
+            with CaptureQueriesContext(connection) as queries:
+                self.login(session_key)
+            return len(queries)
+
+        self.assertEqual(merge(products[:2]), merge(products))
+
+
+class CheckoutTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.case = Product.objects.create(title='Case', price='9.99', discount=33, category=self.category)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.add(cart.pk, {self.product.pk: 2, self.case.pk: 3})
+        self.url = reverse('olcha:cart-checkout')
+
+    def test_checkout_snapshots_prices_and_clears_cart(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual({item['product']: item['price_when_ordered'] for item in response.data['items']},
+                         {self.product.pk: '900.00', self.case.pk: '6.69'})
+        self.assertEqual((response.data['total_order_price'], response.data['item_count']), ('1820.07', 5))
+        self.assertFalse(CartItem.objects.exists())
+
+        Product.objects.filter(pk=self.product.pk).update(price='1.00')
+        self.assertEqual(Order.objects.get().total_order_price, Decimal('1820.07'))
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+
+    def test_idempotency_key(self):
+        first = self.client.post(self.url, headers={'Idempotency-Key': 'abc'})
+        CartItem.objects.add(Cart.objects.get(user=self.user).pk, {self.product.pk: 1})
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.client.post(self.url, headers={'Idempotency-Key': 'abc'})
+        self.assertEqual((first.status_code, retry.status_code), (201, 200))
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse([query for query in queries.captured_queries if 'INSERT' in query['sql']])
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url)
+        small = len(queries)
+        more = [Product.objects.create(title=f'Cable {i}', price='5.00', category=self.category) for i in range(20)]
+        CartItem.objects.add(Cart.objects.get(user=self.user).pk, {product.pk: 1 for product in more})
+        with self.assertNumQueries(small):
+            self.client.post(self.url)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertIn(self.client.post(self.url).status_code, (401, 403))
+
+
+class OrderHistoryTests(CatalogTestCase):
+    def make_order(self, *items):
+        order = Order.objects.create(user=self.user, status='pending')
+        for quantity, price in items:
+            OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price_when_ordered=price)
+        return order
+
+    def test_totals_are_stored_and_maintained(self):
+        order = self.make_order((2, '12.50'), (1, '3.25'))
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.item_count), (Decimal('28.25'), 3))
+        order.items.first().delete()
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.item_count), (Decimal('3.25'), 1))
+
+    def test_history_query_count_does_not_grow(self):
+        other = CustomUser.objects.create_user(username='vali', phone_number='+998901234569', password='pass')
+        Order.objects.create(user=other, status='pending')
+        self.client.force_login(self.user)
+        url = reverse('olcha:orders-list')
+        self.make_order((1, '10.00'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'cursor': ''})
+        one_order = len(queries)
+        for i in range(5):
+            self.make_order((1, '10.00'), (2, '5.00'))
+        with self.assertNumQueries(one_order):
+            response = self.client.get(url, {'cursor': ''})
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(response.data['results'][0]['total_order_price'], '20.00')
+        self.assertEqual(response.data['results'][0]['items'][0]['title'], 'iPhone')
+
+    def test_requires_login(self):
+        self.assertIn(self.client.get(reverse('olcha:orders-list')).status_code, (401, 403))
+
+
+class ConcurrentCartTests(IsolatedCacheMixin, TransactionTestCase):
+    def test_parallel_adds_are_not_lost(self):
+        group = CategoryGroup.objects.create(title='Electronics', image='category_groups/e.png')
+        category = Category.objects.create(title='Phones', image='category/p.png', groups=group)
+        product = Product.objects.create(title='iPhone', price='1000.00', category=category)
+        cart = Cart.objects.create(user=CustomUser.objects.create_user(
+            username='ali', phone_number='+998901234567', password='pass'))
+        threads, adds = 8, 10
+
+        def add():
+            try:
+                for _ in range(adds):
+                    for attempt in range(50):
+                        try:
+                            CartItem.objects.add(cart.pk, {product.pk: 1})
+                            break
+                        except OperationalError:
+                            # sqlite test bazasi bir vaqtda bitta yozuvchiga ruxsat beradi
+                            time.sleep(0.01)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(threads) as executor:
+            for future in [executor.submit(add) for _ in range(threads)]:
+                future.result()
+        self.assertEqual(CartItem.objects.get(cart=cart).quantity, threads * adds)
+
+
+class FastSerializerTests(CatalogTestCase):
+    def test_output_matches_product_serializer(self):
+        ram = AttributeKey.objects.create(key='RAM')
+        for value in ('8GB', '16GB'):
+            ProductAttribute.objects.create(product=self.product, key=ram, value=AttributeValue.objects.create(value=value))
+        Product.objects.create(title='Cable', description='USB-C', price='5.55', discount=33, category=self.category)
+        Comment.objects.create(text='good', rating=4, user=self.user, product=self.product)
+
+        queryset = Product.objects.order_by('pk')
+        expected = ProductSerializer(queryset.prefetch_related('attributes'), many=True).data
+        fast = ProductFastSerializer()
+        self.assertEqual(JSONRenderer().render(fast.serialize(fast.rows(queryset))), JSONRenderer().render(expected))
+
+    def test_detail_and_list_responses(self):
+        detail = self.client.get(reverse('olcha:products-detail', args=[self.product.pk]))
+        self.assertEqual(detail.content, JSONRenderer().render(ProductSerializer(Product.objects.get(pk=self.product.pk)).data))
+        self.assertEqual(self.client.get(reverse('olcha:products-detail', args=['x'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('olcha:products-detail', args=[0])).status_code, 404)
+
+
+class FinalPriceTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.case = Product.objects.create(title='Case', price='9.99', discount=33, category=cls.category)
+        cls.laptop = Product.objects.create(title='MacBook', price='2000.00', discount=50, category=cls.other_category)
+
+    def titles(self, **params):
+        return [product['title'] for product in self.client.get(reverse('olcha:products-list'), params).json()['results']]
+
+    def test_column_follows_price_and_discount(self):
+        self.assertEqual(Product.objects.get(pk=self.case.pk).final_price, Decimal('6.69'))
+        Product.objects.filter(pk=self.product.pk).update(discount=25)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).final_price, Decimal('750.00'))
+        product = Product.objects.get(pk=self.laptop.pk)
+        product.price = Decimal('1999.99')
+        product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.final_price, Decimal('1000.00'))
+
+    def test_halves_are_rounded_away_from_zero(self):
+        for price, discount, final_price in [('10.05', 50, '5.03'), ('0.05', 50, '0.03'), ('2.25', 50, '1.13')]:
+            product = Product.objects.create(title=f'Half {price}', price=price, discount=discount,
+                                             category=self.category)
+            product.refresh_from_db()
+            self.assertEqual(product.final_price, Decimal(final_price), price)
+
+    def test_write_responses_have_the_new_final_price(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        url = reverse('olcha:products-detail', args=[self.product.pk])
+        response = self.client.patch(url, {'discount': 50}, content_type='application/json')
+        self.assertEqual(response.json()['final_price'], 500.0)
+        response = self.client.post(reverse('olcha:products-list'), {
+            'title': 'iPad', 'price': '600.00', 'discount': 25, 'category': self.category.pk})
+        self.assertEqual(response.json()['final_price'], 450.0)
+
+    def test_filter_and_ordering(self):
+        self.assertEqual(self.titles(final_price_min='800', final_price_max='1000'), ['MacBook', 'iPhone'])
+        self.assertEqual(self.titles(ordering='-final_price'), ['MacBook', 'iPhone', 'Case'])
+        self.assertEqual(self.titles(ordering='final_price', cursor='', limit=1), ['Case'])
+
+
+class CartTotalTests(CatalogTestCase):
+    def test_cart_totals_are_computed_in_sql(self):
+        url = reverse('olcha:cart-add-to-cart')
+        self.client.post(url, {'pk': self.product.pk, 'quantity': 3})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('olcha:cart-list'))
+        one_item = len(queries)
+
+        for i in range(5):
+            product = Product.objects.create(title=f'Case {i}', price='9.99', discount=33, category=self.category)
+            self.client.post(url, {'pk': product.pk, 'quantity': 2})
+        with self.assertNumQueries(one_item):
+            response = self.client.get(reverse('olcha:cart-list'))
+
+        self.assertEqual(len(response.data['cart_items']), 6)
+        self.assertEqual(response.data['cart_items'][0]['total_item_price'], Decimal('2700.00'))
+        self.assertEqual(response.data['total_cart_price'], Decimal('2700.00') + 5 * 2 * Decimal('6.69'))
+
+    def test_order_total(self):
+        order = Order.objects.create(user=self.user, status='pending')
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price_when_ordered='12.50')
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price_when_ordered='3.25')
+        self.assertEqual(order.total_order_price, Decimal('28.25'))
+        self.assertEqual(Order.objects.with_totals().get().total_order_price, Decimal('28.25'))
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(7):
+            product = Product.objects.create(title=f'Phone {i}', price=f'{100 + i % 3}.00', category=cls.category)
+            if i % 2:
+                Comment.objects.create(text='ok', rating=i % 5 + 1, user=cls.user, product=product)
+
+    def walk(self, ordering):
+        url = f"{reverse('olcha:products-list')}?cursor=&limit=2&ordering={ordering}"
+        titles = []
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertNotIn('count', response.json())
+            titles += [product['title'] for product in response.json()['results']]
+            url = response.json()['next']
+        return titles
+
+    def test_pages_follow_ordering_with_pk_tiebreaker(self):
+        for ordering in ['price', '-price', 'created_at', 'avg_rating', '-avg_rating', 'title']:
+            name = ordering.lstrip('-')
+            if ordering.startswith('-'):
+                expected = Product.objects.order_by(F(name).desc(nulls_last=True), '-pk')
+            else:
+                expected = Product.objects.order_by(F(name).asc(nulls_last=True), 'pk')
+            with self.subTest(ordering=ordering):
+                self.assertEqual(self.walk(ordering), [product.title for product in expected])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('olcha:comments-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+        for position in (['abc', 1], [{'a': 1}, 1], ['100.00', 'x'], ['100.00']):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get(reverse('olcha:products-list'), {'ordering': 'price', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+        cursor = base64.urlsafe_b64encode(json.dumps(['1000.00', self.product.pk - 1]).encode()).decode()
+        response = self.client.get(reverse('olcha:products-list'), {'ordering': 'price', 'cursor': cursor})
+        self.assertEqual([item['title'] for item in response.json()['results']], ['iPhone'])
+
+
+class SearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Product.objects.create(title='Galaxy S24', description='Android phone with iPhone-like camera',
+                               price='900.00', category=cls.category)
+        Product.objects.create(title='Charger', description='Fast charger', price='20.00',
+                               category=cls.other_category, brand=cls.brand)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('olcha:products-list'), {'search': query, **params})
+        return [product['title'] for product in response.json()['results']]
+
+    def test_results_are_ranked_and_prefix_matched(self):
+        self.assertEqual(self.search('iph'), ['iPhone', 'Galaxy S24'])
+
+    def test_brand_and_category_titles_are_searchable(self):
+        self.assertEqual(self.search('apple'), ['iPhone', 'Charger'])
+        self.assertEqual(self.search('apple laptops'), ['Charger'])
+
+    def test_index_follows_brand_rename(self):
+        self.brand.title = 'Pear'
+        self.brand.save()
+        self.assertEqual(self.search('apple'), [])
+        self.assertEqual(self.search('pear', ordering='price'), ['Charger', 'iPhone'])
+
+    def test_deleted_products_leave_the_index(self):
+        Product.objects.get(title='Charger').delete()
+        self.assertEqual(self.search('charger'), [])
+
+    def test_loaddata_fills_the_index(self):
+        load_fixture([{'model': 'olcha.product', 'pk': 500, 'fields': {
+            'title': 'Pixel 9', 'price': '800.00', 'discount': 0, 'category': self.category.pk,
+            'created_at': '2026-01-01T00:00:00Z', 'updated_at': '2026-01-01T00:00:00Z'}}])
+        self.assertEqual(self.search('pixel'), ['Pixel 9'])
+
+    def test_filters_and_ordering_see_every_match(self):
+        Product.objects.create(title='Phone case', price='5.00', category=self.other_category)
+        response = self.client.get(reverse('olcha:products-list'), {'search': 'phone'})
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(self.search('phone', category=self.other_category.pk), ['Phone case'])
+        self.assertEqual(self.search('phone', ordering='price'), ['Phone case', 'Galaxy S24', 'iPhone'])
+        self.assertEqual(self.search('phone', category=self.category.pk, ordering='-price', cursor='', limit=1),
+                         ['iPhone'])
+
+        # relevance bo'yicha keyset sahifalar
+        response = self.client.get(reverse('olcha:products-list'),
+                                   {'search': 'phone', 'category': self.category.pk, 'cursor': '', 'limit': 1})
+        titles = [item['title'] for item in response.json()['results']]
+        response = self.client.get(response.json()['next'])
+        titles += [item['title'] for item in response.json()['results']]
+        self.assertEqual(sorted(titles), ['Galaxy S24', 'iPhone'])
+
+
+class FacetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_brand = Brand.objects.create(title='Samsung', logo='brands/s.png')
+        ram = AttributeKey.objects.create(key='RAM')
+        cls.eight = AttributeValue.objects.create(value='8GB')
+        galaxy = Product.objects.create(title='Galaxy', price='450.00', category=cls.category, brand=cls.other_brand)
+        cheap = Product.objects.create(title='Cheap', price='50.00', category=cls.category, brand=cls.other_brand)
+        Product.objects.create(title='MacBook', price='2000.00', category=cls.other_category, brand=cls.brand)
+        for product in (cls.product, galaxy):
+            ProductAttribute.objects.create(product=product, key=ram, value=cls.eight)
+        cls.cheap = cheap
+
+    def get_facets(self, **params):
+        return self.client.get(reverse('olcha:products-facets'), params).json()
+
+    def test_stored_counts_match_computed_counts(self):
+        stored = facets.as_response(facets.stored_rows(self.category.pk))
+        computed = facets.as_response(facets.count_rows(Product.objects.filter(category=self.category)))
+        self.assertEqual(stored, computed)
+        self.assertEqual(stored['brand'], [{'id': self.other_brand.pk, 'title': 'Samsung', 'count': 2},
+                                           {'id': self.brand.pk, 'title': 'Apple', 'count': 1}])
+        self.assertEqual(stored['price'], [{'range': '0-100', 'count': 1}, {'range': '100-500', 'count': 1},
+                                           {'range': '1000-5000', 'count': 1}])
+        self.assertEqual(stored['attributes'], [{'key': 'RAM', 'value': '8GB', 'count': 2}])
+
+    def test_counts_follow_product_changes(self):
+        self.cheap.category = self.other_category
+        self.cheap.save()
+        self.product.delete()
+        data = self.get_facets(category=self.category.pk)
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['facets']['brand'], [{'id': self.other_brand.pk, 'title': 'Samsung', 'count': 1}])
+        self.assertEqual(data['facets']['attributes'], [{'key': 'RAM', 'value': '8GB', 'count': 1}])
+
+    def test_facets_for_extra_filters_are_computed(self):
+        data = self.get_facets(category=self.category.pk, brand=self.other_brand.pk)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets']['price'], [{'range': '0-100', 'count': 1}, {'range': '100-500', 'count': 1}])
+
+    def test_category_page_reads_stored_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_facets(category=self.category.pk)
+        self.assertFalse([query for query in queries.captured_queries if 'GROUP BY' in query['sql']])
+
+
+class AttributeFilterTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        ram, color = AttributeKey.objects.create(key='RAM'), AttributeKey.objects.create(key='color')
+        values = {name: AttributeValue.objects.create(value=name) for name in ['8GB', '16GB', 'black', 'white']}
+        specs = {'A': ('8GB', 'black'), 'B': ('16GB', 'black'), 'C': ('8GB', 'white'), 'D': ('4GB', 'black')}
+        values['4GB'] = AttributeValue.objects.create(value='4GB')
+        for title, (memory, shade) in specs.items():
+            product = Product.objects.create(title=title, price='10.00', category=cls.category)
+            ProductAttribute.objects.create(product=product, key=ram, value=values[memory])
+            ProductAttribute.objects.create(product=product, key=color, value=values[shade])
+
+    def titles(self, *attributes):
+        response = self.client.get(reverse('olcha:products-list'), {'attribute': attributes})
+        return [product['title'] for product in response.json()['results']]
+
+    def test_and_across_keys(self):
+        self.assertEqual(self.titles('RAM:8GB', 'color:black'), ['A'])
+
+    def test_or_within_key(self):
+        self.assertEqual(self.titles('RAM:8GB', 'RAM:16GB', 'color:black'), ['A', 'B'])
+        self.assertEqual(self.titles('color:white', 'color:black'), ['A', 'B', 'C', 'D'])
+
+    def test_parameter_order_shares_cache_entry(self):
+        self.titles('RAM:16GB', 'RAM:8GB')
+        with self.assertNumQueries(0):
+            self.titles('RAM:8GB', 'RAM:16GB')
+
+
+class ImportCatalogTests(CatalogTestCase):
+    def import_file(self, name, content, *args):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-16' if name.endswith('.json') else 'utf-8') as file:
+            file.write(content)
+        output = StringIO()
+        call_command('import_catalog', path, *args, stdout=output)
+        return output.getvalue()
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_ndjson_creates_and_updates_products(self):
+        self.import_file('catalog.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'title': 'iPhone', 'price': '900.00', 'discount': 0, 'category': 'Phones', 'brand': 'Apple',
+             'attributes': {'RAM': '8GB'}},
+            {'title': 'Pixel', 'price': '600.00', 'category': 'phones', 'brand': 'Google', 'attributes': {'RAM': '8GB'}},
+            {'title': 'Unknown', 'price': '1.00', 'category': 'Nothing'},
+        ]), '--create-brands', '--batch-size', '1')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal('900.00'))
+        pixel = Product.objects.get(title='Pixel')
+        self.assertEqual(pixel.brand.title, 'Google')
+        self.assertFalse(Product.objects.filter(title='Unknown').exists())
+        self.assertEqual(ProductAttribute.objects.filter(value__value='8GB').count(), 2)
+        stored = facets.as_response(facets.stored_rows(self.category.pk))
+        self.assertEqual(stored['attributes'], [{'key': 'RAM', 'value': '8GB', 'count': 2}])
+        response = self.client.get(reverse('olcha:products-list'), {'search': 'pixel'})
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Pixel'])
+
+    def test_dumpdata_json_and_csv(self):
+        output = self.import_file('catalog.json', json.dumps([
+            {'model': 'olcha.cart', 'pk': 5, 'fields': {'user': 1}},
+            {'model': 'olcha.product', 'pk': 9, 'fields': {
+                'title': 'MacBook', 'price': '2000.00', 'category': self.other_category.pk, 'brand': self.brand.pk}},
+            {'model': 'olcha.product', 'pk': 10, 'fields': {'title': 'Lost', 'price': '1.00', 'category': 999}},
+            {'model': 'olcha.productattribute', 'pk': 1, 'fields': {'product': 9, 'key': 3, 'value': 4}},
+            {'model': 'olcha.productattribute', 'pk': 2, 'fields': {'product': 10, 'key': 3, 'value': 4}},
+            {'model': 'olcha.attributekey', 'pk': 3, 'fields': {'key': 'RAM'}},
+            {'model': 'olcha.attributevalue', 'pk': 4, 'fields': {'value': '16GB'}},
+        ]))
+        macbook = Product.objects.get(title='MacBook')
+        self.assertEqual(list(macbook.attributes.values_list('key__key', 'value__value')), [('RAM', '16GB')])
+        self.assertIn('1 product attributes imported, 1 skipped', output)
+        self.assertIn('1 products with an unknown category', output)
+        self.assertIn('1 olcha.cart', output)
+
+        self.import_file('catalog.csv', 'title,price,category,brand,attr:Color\nMacBook,1800,Laptops,apple,Gray\n')
+
+        macbook = Product.objects.get(title='MacBook')
+        self.assertEqual((macbook.price, macbook.category, macbook.brand), (Decimal('1800'), self.other_category, self.brand))
+        self.assertEqual(list(macbook.attributes.values_list('key__key', 'value__value')), [('Color', 'Gray')])
+
+    def test_dumpdata_catalog_records_are_matched_or_created(self):
+        output = self.import_file('catalog.json', json.dumps([
+            {'model': 'olcha.categorygroup', 'pk': 7, 'fields': {'title': 'Gadgets', 'image': 'category_groups/g.png'}},
+            {'model': 'olcha.category', 'pk': 7, 'fields': {'title': 'Watches', 'image': 'category/w.png', 'groups': 7}},
+            {'model': 'olcha.category', 'pk': 8, 'fields': {'title': 'Phones', 'image': 'category/p.png', 'groups': 7}},
+            {'model': 'olcha.category', 'pk': 9, 'fields': {'title': 'Orphan', 'groups': 99}},
+            {'model': 'olcha.brand', 'pk': 7, 'fields': {'title': 'Garmin', 'slug': 'garmin', 'logo': 'brands/g.png'}},
+            {'model': 'olcha.brand', 'pk': 8, 'fields': {'title': 'Apple', 'logo': 'brands/a.png'}},
+            {'model': 'olcha.product', 'pk': 1, 'fields': {'title': 'Fenix', 'price': '700.00', 'category': 7, 'brand': 7}},
+            {'model': 'olcha.product', 'pk': 2, 'fields': {'title': 'iPhone', 'price': '950.00', 'category': 8, 'brand': 8}},
+        ]))
+        fenix = Product.objects.get(title='Fenix')
+        self.assertEqual((fenix.category.title, fenix.category.groups.title, fenix.brand.slug),
+                         ('Watches', 'Gadgets', 'garmin'))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.category, self.product.brand),
+                         (Decimal('950.00'), self.category, self.brand))
+        self.assertEqual(Category.objects.filter(title='Phones').count(), 1)
+        self.assertFalse(Category.objects.filter(title='Orphan').exists())
+        self.assertIn('1 categories with an unknown group', output)
+        self.assertIn('Imported 2 products', output)
+
+    def test_updated_products_get_a_new_updated_at(self):
+        before = Product.objects.get(pk=self.product.pk).updated_at
+        self.import_file('catalog.ndjson', json.dumps({'title': 'iPhone', 'price': '800.00', 'category': 'Phones'}))
+        self.assertGreater(Product.objects.get(pk=self.product.pk).updated_at, before)
+
+
+class GenerateCatalogTests(CatalogTestCase):
+    def generate(self, prefix):
+        call_command('generate_catalog', '--products', '300', '--batch-size', '100', '--seed', '7',
+                     '--prefix', prefix, stdout=StringIO())
+        return Product.objects.filter(title__startswith=f'{prefix} ').order_by('pk')
+
+    def test_generated_catalog_is_reproducible_and_consistent(self):
+        first = list(self.generate('A').values_list('price', 'discount', 'rating_count'))
+        second = list(self.generate('B').values_list('price', 'discount', 'rating_count'))
+        self.assertEqual(len(first), 300)
+        self.assertEqual(first, second)
+
+        product = Product.objects.filter(title__startswith='A ').order_by('-rating_count').first()
+        self.assertEqual(product.rating_count, product.comments.count())
+        self.assertEqual(product.rating_5, product.comments.filter(rating=5).count())
+        for order in Order.objects.filter(user__username__startswith='a_user_')[:20]:
+            items = list(order.items.all())
+            self.assertEqual(order.total, sum(item.price_when_ordered * item.quantity for item in items))
+            self.assertEqual(order.item_count, sum(item.quantity for item in items))
+        self.assertTrue(ProductAttribute.objects.filter(product__title__startswith='A ').exists())
+        users = CustomUser.objects.filter(username__startswith='a_user_')
+        self.assertEqual(users.filter(profile__isnull=False).count(), users.count())
+        self.client.force_login(users.first())
+        self.assertEqual(self.client.get(reverse('users:profiles-detail', args=[1])).status_code, 200)
+        response = self.client.get(reverse('olcha:products-list'), {'search': product.title})
+        self.assertIn(product.title, [item['title'] for item in response.json()['results']])
+
+
+class BenchmarkEndpointsTests(CatalogTestCase):
+    def benchmark(self, *args):
+        path = os.path.join(self.directory.name, 'baseline.json')
+        call_command('benchmark_endpoints', '--repeat', '1', '--warmup', '0', '--baseline', path, *args,
+                     stdout=StringIO())
+        with open(path) as file:
+            return json.load(file)['endpoints']
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_every_endpoint_is_benchmarked_and_nothing_is_kept(self):
+        from olcha.management.commands.benchmark_endpoints import endpoint_names
+
+        results = self.benchmark('--save-baseline')
+        self.assertEqual(sorted(results), endpoint_names())
+        errors = {name: result['status'] for name, result in results.items()
+                  if any(not status.startswith(('2', '404')) for status in result['status'])}
+        self.assertEqual(errors, {})
+        self.assertEqual(results['olcha:cart-checkout']['status'], {'201': 1})
+        self.assertFalse(CustomUser.objects.filter(username__startswith='benchmark').exists())
+        self.assertFalse(Order.objects.exists())
+
+    def test_replay_and_regression_check(self):
+        log = os.path.join(self.directory.name, 'log.jsonl')
+        with open(log, 'w') as file:
+            file.write(json.dumps({'method': 'GET', 'path': reverse('olcha:products-list')}) + '\n')
+            file.write(json.dumps({'method': 'POST', 'path': reverse('olcha:cart-add-to-cart'),
+                                   'body': {'pk': self.product.pk, 'quantity': 1}, 'user': True}) + '\n')
+        results = self.benchmark('--replay', log, '--save-baseline')
+        self.assertEqual(sorted(results), ['olcha:cart-add-to-cart', 'olcha:products-list'])
+        self.assertEqual(results['olcha:cart-add-to-cart']['status'], {'200': 1})
+
+        with open(os.path.join(self.directory.name, 'baseline.json'), 'w') as file:
+            results['olcha:cart-add-to-cart']['queries'] = 0
+            json.dump({'endpoints': results}, file)
+        with self.assertRaisesMessage(CommandError, 'olcha:cart-add-to-cart'):
+            self.benchmark('--replay', log, '--check', '--threshold', '100000')
+
+
+class ExportTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = CustomUser.objects.create_user(username='admin', phone_number='+998901234568',
+                                                   password='pass', is_staff=True)
+        ram = AttributeKey.objects.create(key='RAM')
+        ProductAttribute.objects.create(product=cls.product, key=ram, value=AttributeValue.objects.create(value='8GB'))
+        Product.objects.create(title='MacBook', price='2000.00', category=cls.other_category)
+
+    def export(self, **params):
+        response = self.client.get(reverse('olcha:products-export'), params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(reverse('olcha:products-export')).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('olcha:products-export')).status_code, 403)
+
+    def test_ndjson(self):
+        self.client.force_login(self.staff)
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['iPhone', 'MacBook'])
+        self.assertEqual(rows[0]['final_price'], '900.00')
+        self.assertEqual(rows[0]['attributes'], {'RAM': '8GB'})
+        self.assertEqual((rows[1]['brand'], rows[1]['category'], rows[1]['rating_count']), (None, 'Laptops', 0))
+
+    def test_csv_with_filters(self):
+        self.client.force_login(self.staff)
+        response, content = self.export(format='csv', category=self.category.pk)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['title'], rows[0]['brand'], rows[0]['attr:RAM']), ('iPhone', 'Apple', '8GB'))
+
+
+class RatingAggregateTests(CatalogTestCase):
+    def test_comments_update_stored_rating(self):
+        first = Comment.objects.create(text='ok', rating=3, user=self.user, product=self.product)
+        Comment.objects.create(text='great', rating=5, user=self.user, product=self.product)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.avg_rating, self.product.rating_count), (4.0, 2))
+
+        first.rating = 4
+        first.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_3, self.product.rating_4, self.product.avg_rating), (0, 1, 4.5))
+
+        first.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.avg_rating, self.product.rating_count, self.product.rating_4), (5.0, 1, 0))
+
+    def test_rebuild_ratings_command(self):
+        Comment.objects.create(text='ok', rating=2, user=self.user, product=self.product)
+        Product.objects.update(avg_rating=None, rating_count=0, rating_2=0)
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.avg_rating, self.product.rating_count, self.product.rating_2), (2.0, 1, 1))
+
+    def test_loaddata_rebuilds_facets_and_ratings(self):
+        dates = {'created_at': '2026-01-01T00:00:00Z', 'updated_at': '2026-01-01T00:00:00Z'}
+        load_fixture([
+            {'model': 'olcha.product', 'pk': 500, 'fields': {
+                'title': 'Pixel 9', 'price': '800.00', 'discount': 0, 'category': self.other_category.pk,
+                'brand': self.brand.pk, **dates}},
+            {'model': 'olcha.comment', 'pk': 500, 'fields': {
+                'text': 'good', 'rating': 4, 'user': self.user.pk, 'product': 500, **dates}},
+        ])
+        product = Product.objects.get(pk=500)
+        self.assertEqual((product.avg_rating, product.rating_count, product.rating_4), (4.0, 1, 1))
+        stored = facets.as_response(facets.stored_rows(self.other_category.pk))
+        self.assertEqual(stored['brand'], [{'id': self.brand.pk, 'title': 'Apple', 'count': 1}])
+
+
+class BenchmarkHelperTests(IsolatedCacheMixin, SimpleTestCase):
+    def test_percentile_is_nearest_rank(self):
+        timings = list(range(1, 101))
+        self.assertEqual([percentile(timings, p) for p in (50, 95, 99, 100)], [50, 95, 99, 100])
+        self.assertEqual(percentile([7.0], 99), 7.0)
+        self.assertEqual(len(measure(lambda: None, 3)), 3)
+
+
+class GetOrBuildTests(IsolatedCacheMixin, SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_stale_entry_is_served_while_another_caller_rebuilds(self):
+        cache.set('key', (0, 'stale'))
+        cache.add(caching.LOCK_KEY.format('key'), 1)
+        self.assertEqual(caching.get_or_build('key', lambda: 'fresh'), 'stale')
+
+    def test_lock_holder_refreshes_stale_entry(self):
+        cache.set('key', (0, 'stale'))
+        self.assertEqual(caching.get_or_build('key', lambda: 'fresh'), 'fresh')
+        self.assertEqual(caching.get_or_build('key', lambda: 'newer'), 'fresh')
+        self.assertIsNone(cache.get(caching.LOCK_KEY.format('key')))
+
+
+def publish_events(path, count):
+    """Publish events and take locks in a forked child, return its results."""
+    # Pool emas: parallel test runner workerlari daemon, ular Pool ocha olmaydi
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        shared = SQLiteCache(path, {})
+        result = [shared.publish(f'key:{i}') for i in range(count)], [shared.add(f'lock:{i}', 1, 10) for i in range(count)]
+        with os.fdopen(write, 'w') as pipe:
+            json.dump(result, pipe)
+        os._exit(0)
+    os.close(write)
+    return pid, os.fdopen(read)
+
+
+class SQLiteCacheTests(IsolatedCacheMixin, SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cache.sqlite3')
+
+    def test_events_and_locks_are_atomic_across_processes(self):
+        children = [publish_events(self.path, 50) for _ in range(4)]
+        results = []
+        for pid, pipe in children:
+            with pipe:
+                results.append(json.load(pipe))
+            os.waitpid(pid, 0)
+        events = [event for published, locks in results for event in published]
+        self.assertEqual(sorted(events), list(range(1, 201)))
+        # har bir lockni faqat bitta jarayon oladi
+        self.assertEqual(sum(sum(locks) for published, locks in results), 50)
+        last, keys = SQLiteCache(self.path, {}).events(190)
+        self.assertEqual((last, len(keys)), (200, 10))
+
+    def test_cull_keeps_entries_without_timeout(self):
+        shared = SQLiteCache(self.path, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+        shared.set('generation:products', 1, timeout=None)
+        for i in range(50):
+            shared.set(f'entry:{i}', i, timeout=60 + i)
+        self.assertEqual(shared.get('generation:products'), 1)
+        self.assertEqual(shared.get('entry:49'), 49)
+        self.assertIsNone(shared.get('entry:0'))
+
+    def test_event_log_is_trimmed(self):
+        shared = SQLiteCache(self.path, {'OPTIONS': {'EVENT_LOG_SIZE': 5}})
+        for i in range(10):
+            shared.publish(f'key:{i}')
+        self.assertEqual(shared.events(8), (10, ['key:8', 'key:9']))
+        self.assertEqual(shared.events(2), (10, None))
+
+
+class TieredCacheTests(IsolatedCacheMixin, SimpleTestCase):
+    def setUp(self):
+        options = {'OPTIONS': {'LOCAL_TIMEOUT': 60, 'SYNC_INTERVAL': 0}}
+        self.worker_a = TieredCache('shared', options)
+        self.worker_b = TieredCache('shared', options)
+        self.worker_a.clear()
+
+    def test_write_in_one_worker_reaches_the_other(self):
+        self.worker_a.set('key', 1)
+        self.assertEqual(self.worker_b.get('key'), 1)
+        self.worker_a.set('key', 2)
+        self.assertEqual(self.worker_b.get('key'), 2)
+        self.worker_a.delete('key')
+        self.assertIsNone(self.worker_b.get('key'))
+
+    def test_stats_count_both_tiers(self):
+        self.worker_a.set('key', 1)
+        self.worker_b.get('key')
+        self.worker_b.get('key')
+        self.worker_b.get('missing')
+        stats = self.worker_b.stats()
+        self.assertEqual(stats['local_hits'], 1)
+        self.assertEqual(stats['shared_hits'], 1)
+        self.assertEqual(stats['shared_misses'], 1)
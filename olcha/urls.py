@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework import routers
 from olcha.views import CategoryGroupViewSet, CategoryViewSet, ProductViewSet, CartViewSet, CommentsViewSet, \
-    BrandViewSet
+    BrandViewSet, OrderViewSet
 
 app_name = 'olcha'
 
@@ -12,6 +12,7 @@ router.register(r'brands', BrandViewSet, basename='brands')
 router.register(r'products', ProductViewSet, basename='products')
 router.register(r'cart', CartViewSet, basename='cart')
 router.register(r'comments', CommentsViewSet, basename='comments')
+router.register(r'orders', OrderViewSet, basename='orders')
 
 
 urlpatterns = [
@@ -1,26 +1,30 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, Http404
+from django.db import transaction, IntegrityError
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework.decorators import action
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from olcha import permissions
+from olcha import permissions, caching, facets
 from olcha.models import (
     CategoryGroup,
     Category,
-    Product, Cart, CartItem, Brand, Comment)
-from olcha.paginations import MyPagination
+    Product, Cart, CartItem, Brand, Comment, ProductAttribute, AttributeKey, Order, OrderItem, money)
+from olcha.filters import ProductFilter, ProductSearchFilter, ProductOrderingFilter, ProductAttributeFilter
+from olcha.paginations import MyPagination, KeysetPagination
+from olcha.renderers import NDJSONRenderer, CSVRenderer
 from olcha.serializers import CategoryGroupSerializer, CategorySerializer, ProductSerializer, CartSerializer, \
-    BrandSerializer, CommentSerializer, AddToCartSerializer
+    BrandSerializer, CommentSerializer, AddToCartSerializer, CartItemQuantitySerializer, \
+    CartBatchSerializer, OrderSerializer, ProductFastSerializer
 from rest_framework import status
 from rest_framework.response import Response
-from django.db.models import Avg
-from django.db.models.functions import Round
+from rest_framework.utils.urls import replace_query_param
 from collections import defaultdict
-from django.core.cache import cache
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from rest_framework import filters
+from django.db.models import Prefetch, Count, F, Window
+from django.db.models.functions import RowNumber
 from django_filters.rest_framework import DjangoFilterBackend
 
 
@@ -28,6 +32,15 @@ from django_filters.rest_framework import DjangoFilterBackend
 # Create your views here.
 
 
+def attributes_prefetch():
+    # key va value StringRelatedField bo'lgani uchun bir so'rovda olinadi
+    return Prefetch('attributes', queryset=ProductAttribute.objects.select_related('key', 'value'))
+
+
+def order_items_prefetch():
+    return Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('pk'))
+
+
 class CategoryGroupViewSet(ModelViewSet):
     queryset = CategoryGroup.objects.all()
     serializer_class = CategoryGroupSerializer
@@ -36,22 +49,12 @@ class CategoryGroupViewSet(ModelViewSet):
     lookup_field = 'slug'
 
     def list(self, request, *args, **kwargs):
-        cache_key = "category_group_list"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-        queryset = self.get_queryset()
+        return caching.cached_response(request, 'category_group_list', [caching.CATEGORY_GROUPS],
+                                       lambda: self.get_serializer(self.get_queryset(), many=True).data)
 
-        serializer = self.get_serializer(queryset, many=True)
-        data = serializer.data
-        cache.set(cache_key, data, timeout=60)
-        return Response(data)
-
-    @method_decorator(cache_page(60))
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        return caching.cached_response(request, 'category_group_detail', [caching.CATEGORY_GROUPS],
+                                       lambda: self.get_serializer(self.get_object()).data, kwargs['slug'])
 
 class CategoryViewSet(ModelViewSet):
     queryset = Category.objects.all()
@@ -62,22 +65,12 @@ class CategoryViewSet(ModelViewSet):
     authorization_classes = [JWTAuthentication]
 
     def list(self, request, *args, **kwargs):
-        cache_key = "catgory_list"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
-
-        queryset = self.get_queryset()
+        return caching.cached_response(request, 'category_list', [caching.CATEGORIES],
+                                       lambda: self.get_serializer(self.get_queryset(), many=True).data)
 
-        serializer = self.get_serializer(queryset, many=True)
-        data = serializer.data
-        cache.set(cache_key, data, timeout=60)
-        return Response(data)
-
-    @method_decorator(cache_page(60))
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        return caching.cached_response(request, 'category_detail', [caching.CATEGORIES],
+                                       lambda: self.get_serializer(self.get_object()).data, kwargs['slug'])
 
 
 
@@ -85,96 +78,198 @@ class BrandViewSet(ModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     permission_classes = [permissions.IsStaffOrReadOnly]
-    pagination_class = MyPagination
+    pagination_class = KeysetPagination
     lookup_field = 'slug'
+    brand_page_params = ['category', 'limit', 'offset']
+    brand_group_limit = 10
+    fast_serializer = ProductFastSerializer()
 
-
+    def list(self, request, *args, **kwargs):
+        query = caching.canonical_query(request.query_params, ['limit', 'offset', 'cursor'])
+        return caching.cached_response(request, 'brand_list', [caching.BRANDS],
+                                       lambda: super(BrandViewSet, self).list(request, *args, **kwargs).data, query)
 
     def retrieve(self, request, slug=None, *args, **kwargs):
         brand = get_object_or_404(Brand, slug=slug)
-
-        products = Product.objects.filter(brand=brand) \
-            .select_related('category') \
-            .prefetch_related('attributes')
+        # faqat shu brend productlari (yoki brendning o'zi) o'zgarganda yangilanadi
+        namespaces = [caching.brand_products_namespace(brand.pk), caching.CATEGORIES, caching.CATALOG]
+        query = caching.canonical_query(request.query_params, self.brand_page_params)
+        return caching.cached_response(request, 'brand_detail', namespaces,
+                                       lambda: self.get_brand_page(request, brand), brand.pk, query)
+
+    def get_brand_page(self, request, brand):
+        """
+        The brand's products grouped by category. Every group has its product
+        count and at most `limit` products; `?category=<id>&offset=` pages
+        through a single group, its `next` link points there.
+        """
+        pagination = MyPagination()
+        pagination.default_limit = self.brand_group_limit
+        limit, offset = pagination.get_limit(request), pagination.get_offset(request)
+
+        products = Product.objects.filter(brand=brand)
+        category_id = request.query_params.get('category')
+        if category_id:
+            if not category_id.isdigit():
+                raise ValidationError({'category': 'A valid integer is required.'})
+            products = products.filter(category_id=category_id)
+
+        groups = products.order_by().values('category_id', 'category__title') \
+            .annotate(count=Count('pk')).order_by('category__title')
+        position = Window(RowNumber(), partition_by=F('category_id'), order_by=[F('title').asc(), F('pk').asc()])
+        page = products.annotate(position=position) \
+            .filter(position__gt=offset, position__lte=offset + limit) \
+            .order_by('category_id', 'position')
 
         grouped = defaultdict(list)
-        for product in products:
-            grouped[product.category.title].append(product)
+        for product in self.fast_serializer.serialize(self.fast_serializer.rows(page)):
+            grouped[product['category']].append(product)
 
         data = []
-        for category_title, products_in_category in grouped.items():
+        for group in groups:
+            next_link = None
+            if offset + limit < group['count']:
+                next_link = replace_query_param(request.build_absolute_uri(), 'category', group['category_id'])
+                next_link = replace_query_param(next_link, 'limit', limit)
+                next_link = replace_query_param(next_link, 'offset', offset + limit)
             data.append({
-                "category": category_title,
-                "products": ProductSerializer(products_in_category, many=True).data
+                "category": group['category__title'],
+                "category_id": group['category_id'],
+                "count": group['count'],
+                "next": next_link,
+                "products": grouped[group['category_id']],
             })
 
-        return Response({
+        return {
             "brand": {
                 "title": brand.title,
                 "logo": brand.logo.url if brand.logo else None,
             },
             "data": data
-        })
+        }
 
 class ProductViewSet(ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsStaffOrReadOnly]
-    pagination_class = MyPagination
+    pagination_class = KeysetPagination
 
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'brand', 'price']
-    search_fields = ['title']
-    ordering_fields = ['price', 'created_at', 'avg_rating']
+    filter_backends = [DjangoFilterBackend, ProductAttributeFilter, ProductSearchFilter, ProductOrderingFilter]
+    filterset_class = ProductFilter
+    search_fields = ['title', 'description', 'brand__title', 'category__title']
+    ordering_fields = ['price', 'final_price', 'created_at', 'avg_rating', 'title']
     ordering = ['title']
+    list_cache_params = ['search', 'ordering', 'category', 'brand', 'price', 'final_price_min', 'final_price_max',
+                         'attribute', 'limit', 'offset', 'cursor']
+    facet_filter_params = ['search', 'category', 'brand', 'price', 'final_price_min', 'final_price_max', 'attribute']
+    export_fields = ['id', 'title', 'description', 'category', 'brand', 'price', 'discount', 'final_price',
+                     'avg_rating', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+    export_chunk_size = 2000
+    fast_serializer = ProductFastSerializer()
 
     def get_queryset(self):
-        queryset =  Product.objects.annotate(avg_rating=Round(Avg("comments__rating"), precision=2)).prefetch_related('attributes')
+        queryset =  Product.objects.prefetch_related(attributes_prefetch())
         return queryset
 
-    def list(self, request, *args, **kwargs):
-        filters = ['search', 'ordering', 'category', 'brand', 'price']
-        is_filtered = any(param in request.query_params for param in filters)
-
-        if is_filtered:
-            queryset = self.filter_queryset(self.get_queryset())
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data)
-
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
-
-
-
-        limit = request.query_params.get('limit', '')
-        offset = request.query_params.get('offset', '')
-        page = request.query_params.get('page', '')
-
-        cache_key = f"product_list_limit_{limit}_offset_{offset}_page_{page}"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
+    def get_id_params(self, name):
+        """
+        The ids of query param `name` as ints. Namespaces are built from them, so
+        `01` has to become `1` (the namespace signals bump) and junk is rejected
+        before it creates a generation key.
+        """
+        values = [value.strip() for value in self.request.query_params.getlist(name) if value.strip()]
+        if not all(value.isdigit() for value in values):
+            raise ValidationError({name: 'A valid integer is required.'})
+        return [int(value) for value in values]
+
+    def get_list_cache_namespaces(self):
+        params = self.request.query_params
+        namespaces = [caching.category_products_namespace(pk) for pk in self.get_id_params('category')]
+        namespaces += [caching.brand_products_namespace(pk) for pk in self.get_id_params('brand')]
+        namespaces = (namespaces or [caching.PRODUCTS]) + [caching.CATALOG]
+        if params.get('search'):
+            # brend va kategoriya nomlari ham qidiriladi
+            namespaces += [caching.BRANDS, caching.CATEGORIES]
+        return namespaces
 
-        queryset = self.get_queryset()
-
-        page = self.paginate_queryset(queryset)
+    def list(self, request, *args, **kwargs):
+        query = caching.canonical_query(request.query_params, self.list_cache_params)
+        return caching.cached_response(request, 'product_list', self.get_list_cache_namespaces(),
+                                       lambda: self.get_page_data(self.filter_queryset(self.get_queryset())), query)
 
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            response = self.get_paginated_response(serializer.data)
+    def retrieve(self, request, *args, **kwargs):
+        if not kwargs['pk'].isdigit():
+            raise Http404
+        pk = int(kwargs['pk'])
+        namespaces = [caching.product_namespace(pk), caching.CATALOG]
+        return caching.cached_response(request, 'product_detail', namespaces, lambda: self.get_product_data(pk))
+
+    def perform_create(self, serializer):
+        serializer.save()
+        # final_price ni baza hisoblaydi, javobda yangi qiymati bo'lsin
+        serializer.instance.refresh_from_db(fields=['final_price'])
+
+    def perform_update(self, serializer):
+        serializer.save()
+        serializer.instance.refresh_from_db(fields=['final_price'])
+
+    def get_page_data(self, queryset):
+        #GET javoblari values() qatorlaridan tez serializer bilan tuziladi
+        page = self.paginate_queryset(self.fast_serializer.rows(queryset))
+        return self.get_paginated_response(self.fast_serializer.serialize(page)).data
+
+    def get_product_data(self, pk):
+        rows = self.fast_serializer.serialize(self.fast_serializer.rows(self.get_queryset().filter(pk=pk)))
+        if not rows:
+            raise Http404
+        return rows[0]
+
+    @action(methods=['GET'], detail=False, url_path='facets', url_name='facets')
+    def facet_counts(self, request, *args, **kwargs):
+        query = caching.canonical_query(request.query_params, self.list_cache_params)
+        namespaces = self.get_list_cache_namespaces() + [caching.BRANDS]
+        return caching.cached_response(request, 'product_facets', namespaces,
+                                       lambda: self.get_facets_data(request), query)
+
+    def get_facets_data(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        data = self.get_page_data(queryset)
+
+        #faqat kategoriya bo'yicha filterlanganda oldindan hisoblangan sonlar ishlatiladi
+        filtered = [name for name in self.facet_filter_params if request.query_params.get(name)]
+        if filtered == ['category']:
+            rows = facets.stored_rows(request.query_params['category'])
         else:
-            serializer = self.get_serializer(queryset, many=True)
-            response = Response(serializer.data)
-
-
-        cache.set(cache_key, response.data, timeout=60)
+            rows = facets.count_rows(queryset)
+        return {**data, 'facets': facets.as_response(rows)}
+
+    @action(methods=['GET'], detail=False, url_path='export', url_name='export',
+            permission_classes=[IsAdminUser], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        """
+        The whole (filtered) catalog as NDJSON or CSV (?format=csv), streamed
+        in chunks so memory does not grow with the catalog. The output can be
+        loaded back with the import_catalog command.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).select_related('category', 'brand').order_by('pk')
+        rows = (self.get_export_row(product) for product in queryset.iterator(chunk_size=self.export_chunk_size))
+        columns = list(self.export_fields)
+        if request.accepted_renderer.format == 'csv':
+            # CSV da har bir atribut alohida ustun
+            keys = AttributeKey.objects.order_by('key').values_list('key', flat=True)
+            columns += [f'attr:{key}' for key in keys]
+            rows = ({**row, **{f'attr:{key}': value for key, value in row.pop('attributes').items()}} for row in rows)
+
+        response = StreamingHttpResponse(request.accepted_renderer.stream(rows, columns),
+                                         content_type=request.accepted_media_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{request.accepted_renderer.format}"'
         return response
 
-    @method_decorator(cache_page(60))
-    def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+    def get_export_row(self, product):
+        row = {field: getattr(product, field) for field in self.export_fields}
+        row['category'] = product.category.title
+        row['brand'] = product.brand.title if product.brand else None
+        row['attributes'] = {attribute.key.key: attribute.value.value for attribute in product.attributes.all()}
+        return row
 
 class CartViewSet(ModelViewSet):
     serializer_class = CartSerializer
@@ -191,10 +286,15 @@ class CartViewSet(ModelViewSet):
             cart, created = Cart.objects.get_or_create(guest_session_key=session_key)
         return cart
 
+    def get_cart_data(self, cart):
+        #jami narxlar SQLda hisoblanadi, itemlar bitta so'rovda keladi
+        items = CartItem.objects.annotate(total_price=money(CartItem.line_total()))
+        cart = Cart.objects.with_totals().prefetch_related(Prefetch('items', queryset=items)).get(pk=cart.pk)
+        return CartSerializer(cart).data
+
     def list(self, request, *args, **kwargs):
         cart = self.get_cart(request)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.get_cart_data(cart))
 
     @action(methods=['POST'], detail=False, serializer_class=AddToCartSerializer)
     def add_to_cart(self, request, *args, **kwargs):
@@ -205,17 +305,104 @@ class CartViewSet(ModelViewSet):
         quantity = serializer.validated_data['quantity']
 
         cart = self.get_cart(request)
-        product = get_object_or_404(Product, pk=pk)
-
-        item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
-            item.quantity += quantity
-        else:
-            item.quantity = quantity
-        item.save()
+        #bitta so'rov: product tekshiriladi, item qo'shiladi yoki soni bazada oshiriladi
+        added = CartItem.objects.add(cart.pk, {pk: quantity})
+        if pk not in added:
+            return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+        item_id, quantity = added[pk]
+        return Response({"id": item_id, "product": pk, "quantity": quantity}, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=False, serializer_class=CartBatchSerializer)
+    def batch(self, request, *args, **kwargs):
+        """
+        Apply a list of add/set/remove operations (by product id) in one
+        transaction and return the final cart. Operations on the same product
+        are combined in order first, then every kind is applied with one query.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
+        changes = {}
+        for operation in serializer.validated_data['operations']:
+            product, quantity = operation['product'], operation.get('quantity')
+            previous = changes.get(product)
+            if operation['op'] == 'remove' or (operation['op'] == 'set' and quantity == 0):
+                changes[product] = ('remove', None)
+            elif operation['op'] == 'set':
+                changes[product] = ('set', quantity)
+            elif previous is None:
+                changes[product] = ('add', quantity)
+            elif previous[0] == 'remove':
+                changes[product] = ('set', quantity)
+            else:
+                changes[product] = (previous[0], previous[1] + quantity)
+
+        adds = {product: quantity for product, (op, quantity) in changes.items() if op == 'add'}
+        sets = {product: quantity for product, (op, quantity) in changes.items() if op == 'set'}
+        removes = [product for product, (op, quantity) in changes.items() if op == 'remove']
 
-        return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+        cart = self.get_cart(request)
+        with transaction.atomic():
+            applied = {**CartItem.objects.add(cart.pk, adds), **CartItem.objects.add(cart.pk, sets, replace=True)}
+            missing = sorted((set(adds) | set(sets)) - set(applied))
+            if missing:
+                # hech narsa saqlanmaydi
+                transaction.set_rollback(True)
+                return Response({"operations": [f"Product {pk} not found." for pk in missing]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if removes:
+                CartItem.objects.filter(cart=cart, product_id__in=removes).delete()
+        return Response(self.get_cart_data(cart), status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=False, permission_classes=[IsAuthenticated])
+    def checkout(self, request, *args, **kwargs):
+        """
+        Turn the user's cart into a pending order. Prices are snapshotted with
+        one query over the cart items and their products, the order items are
+        bulk created and the cart is emptied in the same transaction.
+
+        A request with an `Idempotency-Key` header that was already used by
+        this user returns the existing order instead of a new one.
+        """
+        key = request.headers.get('Idempotency-Key') or None
+        if key is not None and len(key) > 64:
+            return Response({"detail": "Idempotency-Key is too long."}, status=status.HTTP_400_BAD_REQUEST)
+        if key is not None:
+            order = Order.objects.filter(user=request.user, idempotency_key=key).first()
+            if order:
+                return Response(self.get_order_data(order), status=status.HTTP_200_OK)
+
+        with transaction.atomic():
+            # faqat userning cart itemlari qulflanadi, joinlangan product qatorlari emas
+            items = CartItem.objects.select_for_update(of=('self',)) \
+                .filter(cart__user=request.user) \
+                .values_list('pk', 'product_id', 'quantity', 'product__final_price')
+            items = list(items)
+            if not items:
+                return Response({"detail": "Cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(
+                        user=request.user, status='pending', idempotency_key=key,
+                        total=sum(price * quantity for pk, product_id, quantity, price in items),
+                        item_count=sum(quantity for pk, product_id, quantity, price in items),
+                    )
+            except IntegrityError:
+                # shu kalit bilan parallel so'rov orderni yaratib bo'ldi
+                order = Order.objects.get(user=request.user, idempotency_key=key)
+                return Response(self.get_order_data(order), status=status.HTTP_200_OK)
+
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=product_id, quantity=quantity, price_when_ordered=price)
+                for pk, product_id, quantity, price in items
+            ])
+            CartItem.objects.filter(pk__in=[pk for pk, product_id, quantity, price in items]).delete()
+        return Response(self.get_order_data(order), status=status.HTTP_201_CREATED)
+
+    def get_order_data(self, order):
+        order = Order.objects.prefetch_related(order_items_prefetch()).get(pk=order.pk)
+        return OrderSerializer(order).data
 
     @action(methods=['DELETE'], detail=True, url_path='remove-product')
     def remove_from_cart(self, request, pk=None):
@@ -230,26 +417,37 @@ class CartViewSet(ModelViewSet):
     def clear_cart(self, request, *args, **kwargs):
         cart = self.get_cart(request)
         cart.items.all().delete()
-        serializer = CartSerializer(cart)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(self.get_cart_data(cart), status=status.HTTP_200_OK)
 
-    @action(methods=['PATCH'], detail=True, url_path='update-product-quantity')
+    @action(methods=['PATCH'], detail=True, url_path='update-product-quantity',
+            serializer_class=CartItemQuantitySerializer)
     def update_product_quantity(self, request, pk=None):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         cart = self.get_cart(request)
-        item = get_object_or_404(CartItem, pk=pk, cart=cart)
-        try:
-            item.quantity = request.data.get('quantity')
-        except (ValueError, TypeError):
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        else:
-            item.save()
-            return Response("Quantity updated successfully.", status=status.HTTP_200_OK)
+        updated = CartItem.objects.filter(pk=pk, cart=cart).update(
+            quantity=serializer.validated_data['quantity'], updated_at=timezone.now())
+        if not updated:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response("Quantity updated successfully.", status=status.HTTP_200_OK)
 
 class CommentsViewSet(ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.OwnsOrReadOnly]
-    pagination_class = MyPagination
+    pagination_class = KeysetPagination
+
+
+class OrderViewSet(ReadOnlyModelViewSet):
+    """Order history of the current user, newest first."""
+    serializer_class = OrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return Order.objects.filter(user=self.request.user) \
+            .prefetch_related(order_items_prefetch()) \
+            .order_by('-created_at', '-pk')
 
 
 def homepage_url(request):
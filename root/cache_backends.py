@@ -0,0 +1,373 @@
+"""
+Two tier cache backend.
+
+A small bounded LRU kept in the worker process sits in front of a cache
+shared by all workers (SQLiteCache below, one SQLite file per host). Every
+write goes to the shared tier and is announced in its event log; workers
+replay that log at most every SYNC_INTERVAL seconds and drop the keys other
+workers have changed. Local entries also never outlive LOCAL_TIMEOUT, which
+bounds staleness if an event gets lost.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.utils.functional import cached_property
+
+CLEAR_ALL = '*'
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL);
+    CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+    CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL);
+"""
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache in a SQLite file shared by the processes of one host. Every write
+    takes SQLite's write lock (BEGIN IMMEDIATE), so `add` and `incr` are
+    atomic across processes and `add` can be used as a lock.
+
+    When MAX_ENTRIES is reached, expired entries are removed first and then
+    the 1/CULL_FREQUENCY entries closest to expiry. Entries without a timeout
+    (generation counters) are never culled.
+
+    It also keeps the invalidation event log of TieredCache: `publish` appends
+    a key and returns its event id, `events` returns the keys published after
+    an id. Only the last EVENT_LOG_SIZE events are kept.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._event_log_size = options.get('EVENT_LOG_SIZE', 1000)
+        self._connections = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._connections, 'connection', None)
+        # fork qilingan worker ota jarayonning ulanishini ishlatmasin
+        if connection is None or self._connections.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._connections.connection, self._connections.pid = connection, os.getpid()
+        return connection
+
+    def _write(self, work):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    def _expires(self, timeout):
+        # absolute unix time, None = never
+        return self.get_backend_timeout(timeout)
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _cull(self, connection, now):
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count < self._max_entries:
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?', [now])
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count < self._max_entries:
+            return
+        limit = count if self._cull_frequency == 0 else count // self._cull_frequency
+        connection.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE expires IS NOT NULL '
+                           'ORDER BY expires LIMIT ?)', [max(limit, 1)])
+
+    def _store(self, connection, key, value, timeout, mode='set'):
+        now = time.time()
+        expires = self._expires(timeout)
+        if mode == 'add':
+            connection.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', [key, now])
+        self._cull(connection, now)
+        verb = 'INSERT OR IGNORE' if mode == 'add' else 'INSERT OR REPLACE'
+        cursor = connection.execute(f'{verb} INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                    [key, self._dumps(value), expires])
+        return cursor.rowcount == 1
+
+    def _live(self, rows):
+        now = time.time()
+        return {key: pickle.loads(value) for key, value, expires in rows if expires is None or expires > now}
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        rows = self._connection().execute('SELECT key, value, expires FROM cache WHERE key = ?', [key]).fetchall()
+        return self._live(rows).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_and_validate_key(key, version=version): key for key in keys}
+        found = {}
+        made_keys = list(made)
+        for start in range(0, len(made_keys), 500):
+            chunk = made_keys[start:start + 500]
+            rows = self._connection().execute(
+                f'SELECT key, value, expires FROM cache WHERE key IN ({", ".join(["?"] * len(chunk))})', chunk)
+            found.update(self._live(rows.fetchall()))
+        return {made[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(lambda connection: self._store(connection, key, value, timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = [(self.make_and_validate_key(key, version=version), value) for key, value in data.items()]
+        self._write(lambda connection: [self._store(connection, key, value, timeout) for key, value in items])
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda connection: self._store(connection, key, value, timeout, mode='add'))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda connection: connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            [self._expires(timeout), key, time.time()]).rowcount == 1)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda connection: connection.execute(
+            'DELETE FROM cache WHERE key = ?', [key]).rowcount == 1)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def work(connection):
+            rows = connection.execute('SELECT key, value, expires FROM cache WHERE key = ?', [key]).fetchall()
+            found = self._live(rows)
+            if key not in found:
+                raise ValueError(f"Key '{key}' not found.")
+            value = found[key] + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?', [self._dumps(value), key])
+            return value
+        return self._write(work)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', [key, time.time()]
+        ).fetchone() is not None
+
+    def clear(self):
+        self._write(lambda connection: connection.execute('DELETE FROM cache'))
+
+    def close(self, **kwargs):
+        # ulanish thread/jarayon davomida qayta ishlatiladi
+        pass
+
+    # invalidation events
+
+    def publish(self, key):
+        def work(connection):
+            event = connection.execute('INSERT INTO events (key) VALUES (?)', [key]).lastrowid
+            connection.execute('DELETE FROM events WHERE id <= ?', [event - self._event_log_size])
+            return event
+        return self._write(work)
+
+    def events(self, after):
+        """
+        (last event id, keys published after `after`). The keys are None
+        when some of those events were already trimmed from the log.
+        """
+        connection = self._connection()
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        last = row[0] if row else 0
+        if after is None or last == after:
+            return last, []
+        if last < after:
+            return last, None
+        rows = connection.execute('SELECT id, key FROM events WHERE id > ? ORDER BY id', [after]).fetchall()
+        if len(rows) != last - after:
+            return last, None
+        return last, [key for event, key in rows]
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._local = OrderedDict()
+        self._local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._sync_interval = options.get('SYNC_INTERVAL', 1)
+        self._lock = threading.Lock()
+        self._seen_event = None
+        self._next_sync = 0
+        self._stats = dict.fromkeys(['local_hits', 'local_misses', 'shared_hits', 'shared_misses'], 0)
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def stats(self):
+        """Hit/miss counters of both tiers for this process."""
+        with self._lock:
+            return dict(self._stats, local_entries=len(self._local))
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                self._stats[name] += count
+
+    # local tier
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._local.move_to_end(key)
+                self._stats['local_hits'] += 1
+                return True, pickle.loads(entry[1])
+            self._local.pop(key, None)
+            self._stats['local_misses'] += 1
+            return False, None
+
+    def _local_set(self, key, value, timeout):
+        ttl = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        if ttl <= 0:
+            self._local_delete(key)
+            return
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, pickled)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    # cross worker invalidation
+
+    def _publish(self, key):
+        event = self.shared.publish(key)
+        with self._lock:
+            if self._seen_event is not None and event == self._seen_event + 1:
+                self._seen_event = event
+
+    def _sync(self):
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self._sync_interval
+
+        seen = self._seen_event
+        current, keys = self.shared.events(seen)
+        if seen is None or current == seen:
+            self._seen_event = current
+            return
+        if keys is None:
+            keys = [CLEAR_ALL]
+        with self._lock:
+            if CLEAR_ALL in keys:
+                self._local.clear()
+            else:
+                for key in keys:
+                    self._local.pop(key, None)
+            self._seen_event = current
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    # cache api
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        found, value = self._local_get(key)
+        if found:
+            return value
+        value = self.shared.get(key, self)
+        if value is self:
+            self._count(shared_misses=1)
+            return default
+        self._count(shared_hits=1)
+        self._local_set(key, value, None)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        result = {}
+        missing = {}
+        for key in keys:
+            made_key = self.make_and_validate_key(key, version=version)
+            found, value = self._local_get(made_key)
+            if found:
+                result[key] = value
+            else:
+                missing[made_key] = key
+        if missing:
+            shared = self.shared.get_many(missing)
+            self._count(shared_hits=len(shared), shared_misses=len(missing) - len(shared))
+            for made_key, value in shared.items():
+                self._local_set(made_key, value, None)
+                result[missing[made_key]] = value
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self._timeout(timeout)
+        self.shared.set(key, value, timeout)
+        self._publish(key)
+        self._local_set(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self._timeout(timeout)
+        if not self.shared.add(key, value, timeout):
+            return False
+        self._publish(key)
+        self._local_set(key, value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.shared.touch(key, self._timeout(timeout))
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._local_delete(key)
+        deleted = self.shared.delete(key)
+        self._publish(key)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self.shared.incr(key, delta)
+        self._publish(key)
+        self._local_delete(key)
+        return value
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._sync()
+        found, _ = self._local_get(key)
+        return found or self.shared.has_key(key)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+        self._publish(CLEAR_ALL)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -162,6 +163,10 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'olcha.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 INTERNAL_IPS = [
@@ -209,13 +214,32 @@ SIMPLE_JWT = {
 }
 
 
+# har bir worker o'zida kichik LRU saqlaydi, 'shared' esa hamma workerlar uchun umumiy
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-suffix',
-    }
+        'BACKEND': 'root.cache_backends.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': 500,
+            'LOCAL_TIMEOUT': 5,
+            'SYNC_INTERVAL': 0.5,
+        },
+    },
+    # bitta hostdagi workerlar uchun umumiy SQLite fayl, add/incr jarayonlar orasida atomik
+    'shared': {
+        'BACKEND': 'root.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'olcha_cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 4,
+            'EVENT_LOG_SIZE': 1000,
+        },
+    },
 }
 
+#keshlangan javoblar gzip bilan siqilgan holda saqlanadi
+CACHE_RESPONSE_GZIP = True
+
 SESSION_COOKIE_AGE = 60 * 60 * 2
 
 